@@ -0,0 +1,350 @@
+import time
+from collections import deque
+from itertools import islice
+
+import board
+
+# --- ANYTIME AI SEARCH ---
+# Iterative deepening over JOINT moves: each ply the bot picks a move, the
+# nearest opponent answers with its worst-for-us move, and both are applied
+# at once with the engine's rules (collisions checked against the board
+# before anyone moves). Each completed depth replaces the best move; when
+# the deadline passes mid-depth that depth is thrown away, so there is
+# always an answer from the last finished one. Depth 0 is just "any move
+# that doesn't crash right now", which is what runs when there's no time.
+TICK_INTERVAL = 0.1
+SEARCH_BUDGET_FRACTION = 0.6  # Of the tick; the rest is Manager I/O and slack
+MAX_DEPTH = 24
+DEADLINE_CHECK_NODES = 4      # A node (with its flood fill) costs far more than a clock read
+FLOOD_CAP = 96                # Leaf flood fill stops after this many cells
+WIN = 1_000_000
+FOOD_WEIGHT = 4
+SPACE_WEIGHT = 10
+
+# --- PATH CACHE ---
+# Bodies only ever move into cells their head visited, so a planned path can
+# only become blocked by some head stepping onto it. Checking each snake's
+# newest HEAD_WINDOW segments is enough as long as the bot reads the state
+# at least once every HEAD_WINDOW engine ticks.
+HEAD_WINDOW = 3
+DANGER_RADIUS = 3             # Manhattan distance from our head to an opponent's head
+PATH_CHECK_NODES = 512        # BFS cells are cheap: read the clock this often
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchStats:
+    __slots__ = ("nodes", "depth")
+
+    def __init__(self):
+        self.nodes = 0
+        self.depth = 0
+
+
+class _Position:
+    """Make/unmake board for two snakes; everyone else is a static obstacle"""
+
+    def __init__(self, state, me, opponent):
+        self.w = state.get("board_w", board.DEFAULT_BOARD_W)
+        self.h = state.get("board_h", board.DEFAULT_BOARD_H)
+        self.food = state.get("food")
+        self.bodies = {pid: deque(state["players"][pid]) for pid in (me, opponent) if pid is not None}
+        self.occupied = {}
+        for pid, snake in state["players"].items():
+            for segment in snake:
+                self.occupied[segment] = pid
+        self.grown = {pid: 0 for pid in self.bodies}
+
+    def moves(self, pid):
+        """Directions that don't reverse into the neck (the engine would just stop us)"""
+        if pid is None: return [None]
+        snake = self.bodies[pid]
+        hx, hy = snake[-1]
+        neck = snake[-2] if len(snake) > 1 else None
+        return [d for d in board.DIRECTIONS if (hx + d[0], hy + d[1]) != neck]
+
+    def crashes(self, pid, move):
+        """Same test as the engine's RUNNING phase, against the current (pre-move) board"""
+        if move is None: return False
+        hx, hy = self.bodies[pid][-1]
+        cell = (hx + move[0], hy + move[1])
+        return not (0 <= cell[0] < self.w and 0 <= cell[1] < self.h) or cell in self.occupied
+
+    def apply(self, pid, move):
+        """Returns what unapply() needs"""
+        if move is None: return None
+        snake = self.bodies[pid]
+        hx, hy = snake[-1]
+        cell = (hx + move[0], hy + move[1])
+        snake.append(cell)
+        prev_owner = self.occupied.get(cell)
+        self.occupied[cell] = pid
+        if cell == self.food:
+            self.food = None   # The engine respawns it somewhere we can't predict
+            self.grown[pid] += 1
+            return (pid, cell, prev_owner, None, True)
+        tail = snake.popleft()
+        tail_owner = self.occupied.get(tail)
+        if tail_owner == pid: del self.occupied[tail]
+        return (pid, cell, prev_owner, tail, False)
+
+    def unapply(self, undo):
+        if undo is None: return
+        pid, cell, prev_owner, tail, ate = undo
+        snake = self.bodies[pid]
+        if ate:
+            self.food = cell
+            self.grown[pid] -= 1
+        else:
+            snake.appendleft(tail)
+            self.occupied.setdefault(tail, pid)
+        snake.pop()
+        if prev_owner is None: del self.occupied[cell]
+        else: self.occupied[cell] = prev_owner
+
+    def space(self, pid):
+        """Free cells reachable from pid's head, capped at FLOOD_CAP"""
+        if pid is None: return 0
+        start = self.bodies[pid][-1]
+        seen = {start}
+        frontier = deque([start])
+        while frontier and len(seen) < FLOOD_CAP:
+            cx, cy = frontier.popleft()
+            for dx, dy in board.DIRECTIONS:
+                cell = (cx + dx, cy + dy)
+                if cell in seen or cell in self.occupied: continue
+                if not (0 <= cell[0] < self.w and 0 <= cell[1] < self.h): continue
+                seen.add(cell)
+                frontier.append(cell)
+        return len(seen) - 1
+
+
+class AnytimeSearch:
+    def __init__(self, state, me, deadline):
+        self.me = me
+        self.opponent = nearest_opponent(state, me)
+        self.pos = _Position(state, me, self.opponent)
+        self.deadline = deadline
+        self.stats = SearchStats()
+
+    def evaluate(self):
+        pos, me, opp = self.pos, self.me, self.opponent
+        score = SPACE_WEIGHT * (pos.space(me) - pos.space(opp))
+        score += 100 * (pos.grown[me] - (pos.grown[opp] if opp is not None else 0))
+        if pos.food is not None:
+            hx, hy = pos.bodies[me][-1]
+            score -= FOOD_WEIGHT * (abs(hx - pos.food[0]) + abs(hy - pos.food[1]))
+        return score
+
+    def value(self, depth, ply, alpha, beta):
+        """Max over our moves of min over the opponent's replies (alpha-beta)"""
+        stats = self.stats
+        stats.nodes += 1
+        if stats.nodes % DEADLINE_CHECK_NODES == 0 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+        if depth == 0:
+            return self.evaluate()
+
+        pos, me, opp = self.pos, self.me, self.opponent
+        best = -WIN * 2
+        for move in pos.moves(me):
+            worst = WIN * 2
+            for reply in pos.moves(opp):
+                i_crash = pos.crashes(me, move)
+                they_crash = opp is not None and pos.crashes(opp, reply)
+                if i_crash or they_crash:
+                    # Sooner is more certain: a loss now is worse than a loss later
+                    if i_crash and they_crash: v = -WIN // 2 + ply
+                    elif i_crash: v = -WIN + ply
+                    else: v = WIN - ply
+                else:
+                    undo_me = pos.apply(me, move)
+                    undo_opp = pos.apply(opp, reply)
+                    try:
+                        v = self.value(depth - 1, ply + 1, max(alpha, best), min(beta, worst))
+                    finally:
+                        pos.unapply(undo_opp)
+                        pos.unapply(undo_me)
+                worst = min(worst, v)
+                if worst <= max(alpha, best): break   # This move is already worse than one we have
+            best = max(best, worst)
+            if best >= beta: break
+        return best
+
+    def root(self, depth, ordered):
+        """Scores every root move at this depth; returns [(value, move)] best first"""
+        pos, me, opp = self.pos, self.me, self.opponent
+        scored = []
+        alpha = -WIN * 2
+        for move in ordered:
+            worst = WIN * 2
+            for reply in pos.moves(opp):
+                i_crash = pos.crashes(me, move)
+                they_crash = opp is not None and pos.crashes(opp, reply)
+                if i_crash or they_crash:
+                    if i_crash and they_crash: v = -WIN // 2
+                    elif i_crash: v = -WIN
+                    else: v = WIN
+                else:
+                    undo_me = pos.apply(me, move)
+                    undo_opp = pos.apply(opp, reply)
+                    try:
+                        v = self.value(depth - 1, 1, alpha, worst)
+                    finally:
+                        pos.unapply(undo_opp)
+                        pos.unapply(undo_me)
+                worst = min(worst, v)
+                if worst <= alpha: break
+            scored.append((worst, move))
+            alpha = max(alpha, worst)
+        scored.sort(key=lambda item: -item[0])
+        return scored
+
+    def run(self):
+        """Deepens until the deadline; returns the best move of the last finished depth"""
+        pos, me = self.pos, self.me
+        ordered = pos.moves(me)
+        safe = [m for m in ordered if not pos.crashes(me, m)]
+        best_move = self.toward_food(safe) if safe else (ordered[0] if ordered else None)
+
+        depth = 1
+        while depth <= MAX_DEPTH and time.perf_counter() < self.deadline:
+            try:
+                scored = self.root(depth, ordered)
+            except SearchTimeout:
+                break
+            best_move = scored[0][1]
+            self.stats.depth = depth
+            if abs(scored[0][0]) >= WIN // 2 - MAX_DEPTH: break   # Outcome is forced either way
+            ordered = [move for _, move in scored]  # Best first: more cutoffs next depth
+            depth += 1
+
+        return best_move
+
+    def toward_food(self, moves):
+        food = self.pos.food
+        if food is None: return moves[0]
+        hx, hy = self.pos.bodies[self.me][-1]
+        return min(moves, key=lambda d: abs(hx + d[0] - food[0]) + abs(hy + d[1] - food[1]))
+
+
+def find_path(head, goal, obstacles, board_w, board_h, deadline=None):
+    """BFS with parent links. Returns ([head, ..., goal] or None, nodes expanded).
+    Raises SearchTimeout (with the node count) if `deadline` passes first."""
+    frontier = deque([head])
+    parent = {head: None}
+    nodes = 0
+    while frontier:
+        current = frontier.popleft()
+        nodes += 1
+        if deadline is not None and nodes % PATH_CHECK_NODES == 0 and time.perf_counter() >= deadline:
+            raise SearchTimeout(nodes)
+        if current == goal:
+            path = []
+            while current is not None:
+                path.append(current)
+                current = parent[current]
+            path.reverse()
+            return path, nodes
+        cx, cy = current
+        for dx, dy in board.DIRECTIONS:
+            neighbor = (cx + dx, cy + dy)
+            if not (0 <= neighbor[0] < board_w and 0 <= neighbor[1] < board_h): continue
+            if neighbor in obstacles or neighbor in parent: continue
+            parent[neighbor] = current
+            frontier.append(neighbor)
+    return None, nodes
+
+
+class PathCache:
+    """Keeps the bot's planned path to the food and replans only when it has to"""
+
+    def __init__(self):
+        self.path = None
+        self.index = {}        # cell -> position on the path
+        self.food = None
+        self.hits = 0
+        self.misses = 0
+        self.last_nodes = 0    # BFS nodes expanded by the last replan
+        self.timed_out = False # The last replan hit the deadline
+
+    def invalidate(self):
+        self.path = None
+        self.index = {}
+
+    def check(self, state, me):
+        """None if the cached path is still good, else why it isn't"""
+        if self.path is None: return "empty"
+        if state["food"] != self.food: return "food_moved"
+        head = state["players"][me][-1]
+        i = self.index.get(head)
+        if i is None or i + 1 >= len(self.path): return "off_path"
+        hx, hy = head
+        for pid, snake in state["players"].items():
+            if not snake: continue
+            if pid != me:
+                ox, oy = snake[-1]
+                if abs(ox - hx) + abs(oy - hy) <= DANGER_RADIUS: return "danger"
+            for cell in islice(reversed(snake), HEAD_WINDOW):
+                j = self.index.get(cell)
+                if j is not None and j > i: return "blocked"
+        return None
+
+    def next_move(self, state, me, deadline=None):
+        """Next step toward the food, or None when there's no path (or no time to
+        find one). Returns (move, reason): reason is None on a cache hit and the
+        replan cause otherwise."""
+        snake = state["players"][me]
+        reason = self.check(state, me)
+        self.last_nodes = 0
+        self.timed_out = False
+        if reason is None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            obstacles = set()
+            for s in state["players"].values():
+                obstacles.update(s)
+            obstacles.discard(snake[0])   # Own tail moves out of the way
+            board_w = state.get("board_w", board.DEFAULT_BOARD_W)
+            board_h = state.get("board_h", board.DEFAULT_BOARD_H)
+            try:
+                path, self.last_nodes = find_path(snake[-1], state["food"], obstacles, board_w, board_h, deadline)
+            except SearchTimeout as timeout:
+                path, self.last_nodes = None, timeout.args[0]
+                self.timed_out = True
+            if path is None or len(path) < 2:
+                self.invalidate()
+                return None, reason
+            self.path = path
+            self.index = {cell: i for i, cell in enumerate(path)}
+            self.food = state["food"]
+
+        head = snake[-1]
+        step = self.path[self.index[head] + 1]
+        return (step[0] - head[0], step[1] - head[1]), reason
+
+    def steps_left(self, state, me):
+        if self.path is None: return 0
+        return len(self.path) - 1 - self.index.get(state["players"][me][-1], 0)
+
+
+def nearest_opponent(state, me):
+    hx, hy = state["players"][me][-1]
+    best, best_dist = None, None
+    for pid, snake in state["players"].items():
+        if pid == me or not snake: continue
+        ox, oy = snake[-1]
+        dist = abs(ox - hx) + abs(oy - hy)
+        if best_dist is None or dist < best_dist:
+            best, best_dist = pid, dist
+    return best
+
+
+def plan_move(state, me, deadline):
+    """Best move for snake `me` found before `deadline` (a perf_counter time) and its SearchStats"""
+    search = AnytimeSearch(state, me, deadline)
+    move = search.run()
+    return move, search.stats
@@ -1,22 +1,25 @@
 import socket
 import threading
 import pickle
-import random
 import struct
 import time
+import queue
+
+import board
+import gamestate
+import latency
+import telemetry
 
 HOST = "0.0.0.0" 
 PORT = 5555
-GRID_SIZE = 20
-GAME_WIDTH, GAME_HEIGHT = 1000, 1000
-GRID_W = GAME_WIDTH // GRID_SIZE
-GRID_H = GAME_HEIGHT // GRID_SIZE
+TICK_INTERVAL = 0.1  # Game speed: one move per player per tick
 
 # --- NETWORK HELPERS ---
-def send_data(sock, data):
-    try:
-        serialized = pickle.dumps(data)
-        sock.sendall(struct.pack('>I', len(serialized)) + serialized)
+def frame_bytes(serialized):
+    return struct.pack('>I', len(serialized)) + serialized
+
+def send_frame(sock, frame):
+    try: sock.sendall(frame)
     except: pass
 
 def receive_data(sock):
@@ -33,154 +36,192 @@ def receive_data(sock):
     except: return None
 
 # --- SHARED STATE ---
-game_state = {
-    "players": {},
-    "scores": {},
-    "threads": {},
-    "food": (100, 100),
-    "status": "WAITING", 
-    "countdown": 3,
-    "timer_start": None,
-    "winner": None  # NEW: Tracks who won
-}
-
-state_lock = threading.Lock()
-
-def generate_new_food():
-    x = random.randint(2, GRID_W - 2) * GRID_SIZE
-    y = random.randint(2, GRID_H - 2) * GRID_SIZE
-    return (x, y)
-
-def respawn_player(pid):
-    """Resets a single player to a random spot"""
-    sx = random.randint(5, GRID_W-5) * GRID_SIZE
-    sy = random.randint(5, GRID_H-5) * GRID_SIZE
-    return [(sx, sy), (sx+GRID_SIZE, sy)]
+game_state = gamestate.Match()
+
+# Only the tick thread writes game_state. Everyone else reads published_frame,
+# the snapshot pickled ONCE per tick and replaced (never modified) after that.
+published_frame = frame_bytes(game_state.encode())
+state_lock = threading.Lock()   # Guards the published_frame pointer swap only
+input_queue = queue.Queue()     # (pid, "JOIN"|"INPUT"|"LEAVE", value) from client threads
+
+def advance_phase():
+    """Phases 1-4. Runs once per tick on the tick thread."""
+    player_count = len(game_state.players)
+
+    # --- PHASE 1: WAITING ---
+    if player_count < 2:
+        game_state.status = gamestate.WAITING
+        game_state.timer_start = None
+
+    # --- PHASE 2: START COUNTDOWN ---
+    elif player_count >= 2 and game_state.status == gamestate.WAITING:
+        game_state.status = gamestate.COUNTDOWN
+        game_state.timer_start = time.time()
+        # Reset everyone's position for fairness
+        for pid in game_state.players:
+            game_state.spawn(pid)
+        game_state.reset_scores()
+
+    # --- PHASE 3: HANDLING COUNTDOWN ---
+    elif game_state.status == gamestate.COUNTDOWN:
+        elapsed = time.time() - game_state.timer_start
+        if elapsed < 1: game_state.countdown = 3
+        elif elapsed < 2: game_state.countdown = 2
+        elif elapsed < 3: game_state.countdown = 1
+        else: game_state.status = gamestate.RUNNING
+
+    # --- PHASE 4: GAME OVER & RESTART ---
+    elif game_state.status == gamestate.GAME_OVER:
+        # Wait 5 seconds, then restart
+        if time.time() - game_state.timer_start > 5:
+            game_state.status = gamestate.WAITING
+            game_state.winner = None
+            game_state.reset_scores()
+
+def move_player(player_id, direction):
+    """Phase 5 for ONE player. Runs once per tick per player, whatever their send rate."""
+    # --- PHASE 5: RUNNING LOGIC ---
+    if game_state.status == gamestate.RUNNING and player_id in game_state.players:
+        player = game_state.players[player_id]
+        snake = player.snake.body
+        head_x, head_y = snake[-1]
+        dx, dy = direction
+        new_head = (head_x + dx, head_y + dy)
+
+        # --- DEATH CONDITIONS ---
+        died = False
+        # 1. Wall Hit
+        if not board.in_bounds(new_head, game_state.board_w, game_state.board_h):
+            died = True
+            print(f"[TICK] Player {player_id} hit wall.")
+
+        # 2. Self/Enemy Collision
+        # 2. Self/Enemy Collision
+        # We use list() so we can modify the dictionary (kill enemies) while looping
+        for other_pid, other in list(game_state.players.items()):
+            if new_head in other.snake.body:
+
+                # CASE A: You hit yourself (Suicide)
+                if other_pid == player_id:
+                    died = True
+                    print(f"[TICK] Player {player_id} committed suicide.")
+
+                # CASE B: You hit an Enemy
+                else:
+                    my_score = player.score
+                    enemy_score = other.score
+
+                    if my_score > enemy_score:
+                        # YOU WIN: You have more points.
+                        # You survive, and the enemy is removed immediately.
+                        print(f"[TICK] P{player_id} ({my_score}) CRUSHED P{other_pid} ({enemy_score})!")
+
+                        # Kill the enemy immediately
+                        game_state.remove(other_pid)
+
+                        # IMPORTANT: Do not set died=True. You just walk through them.
+                    else:
+                        # YOU LOSE: They have more (or equal) points.
+                        died = True
+                        print(f"[TICK] Player {player_id} lost collision to Player {other_pid}.")
+
+        if died:
+            game_state.status = gamestate.GAME_OVER
+            game_state.timer_start = time.time() # Start 5s timer
+            # Determine Winner (The one who didn't die)
+            # Simplified: If P1 died, P2 wins.
+            survivors = [p for p in game_state.players if p != player_id]
+            if survivors:
+                game_state.winner = survivors[0]
+            else:
+                game_state.winner = "Draw"
+        else:
+            # Move Logic
+            if new_head == game_state.food:
+                snake.append(new_head)
+                game_state.new_food()
+                player.score += 10
+            else:
+                snake.append(new_head)
+                snake.popleft()
+
+def publish_snapshot():
+    """Encodes the state once for every client; the lock only guards the pointer swap"""
+    global published_frame
+    frame = frame_bytes(game_state.encode())
+    with state_lock:
+        published_frame = frame
+
+def apply_event(pid, kind, value, player_inputs):
+    if kind == "JOIN":
+        game_state.spawn(pid).label = value
+        game_state.players[pid].score = 0
+    elif kind == "LEAVE":
+        game_state.remove(pid)
+        player_inputs.pop(pid, None)
+        if len(game_state.players) < 2:
+            game_state.status = gamestate.WAITING
+    elif kind == "INPUT":
+        # Only direction tuples move snakes (e.g. "MODE:PVP" is ignored here);
+        # stamped client moves carry one. Acks and pongs are not sent back,
+        # every player gets the same published frame.
+        if latency.is_move(value): value = value[2]
+        if isinstance(value, (tuple, list)) and len(value) == 2:
+            player_inputs[pid] = tuple(value)
+
+# --- THREAD: TICK ---
+# The ONLY thread that touches game_state. Client threads just enqueue inputs
+# and read the last published snapshot.
+def tick_loop():
+    print("[TICK] Tick thread started")
+    player_inputs = {}   # pid -> last direction; (0, 0) is a real input, not "none yet"
+    while True:
+        tick_start = time.time()
+
+        # 1. Drain every queued event
+        while True:
+            try: pid, kind, value = input_queue.get_nowait()
+            except queue.Empty: break
+            apply_event(pid, kind, value, player_inputs)
+
+        # 2. Phases, then every player moves exactly once
+        advance_phase()
+        for pid in list(game_state.players):
+            if game_state.status != gamestate.RUNNING: break
+            direction = player_inputs.get(pid)
+            if direction and pid in game_state.players:
+                move_player(pid, direction)
+
+        publish_snapshot()
+        time.sleep(max(0, TICK_INTERVAL - (time.time() - tick_start)))
 
 def handle_client(conn, player_id):
     thread_name = threading.current_thread().name
     print(f"[{thread_name}] Connected Player {player_id}")
+    input_queue.put((player_id, "JOIN", thread_name))
 
     try:
         while True:
-            # 1. Input Handling
+            # 1. Input Handling (just enqueue; the tick thread applies it)
             direction = receive_data(conn)
             if direction is None: break
-
+            # No frame for a PING, telemetry or codec request: the client reads one
+            # frame per move it sends, so an extra one would leave it a frame behind.
+            # Frames here are never compressed; the client reads plain ones either way.
+            if latency.is_ping(direction) or telemetry.is_request(direction): continue
+            if isinstance(direction, str) and direction.startswith("CODEC:"): continue
+            input_queue.put((player_id, "INPUT", direction))
+
+            # 2. Send the latest snapshot (pointer read under the lock)
             with state_lock:
-                game_state["threads"][player_id] = thread_name
-                player_count = len(game_state["players"])
-
-                # --- PHASE 1: WAITING ---
-                if player_count < 2:
-                    game_state["status"] = "WAITING"
-                    game_state["timer_start"] = None
-                
-                # --- PHASE 2: START COUNTDOWN ---
-                elif player_count >= 2 and game_state["status"] == "WAITING":
-                    game_state["status"] = "COUNTDOWN"
-                    game_state["timer_start"] = time.time()
-                    # Reset everyone's position for fairness
-                    for pid in game_state["players"]:
-                        game_state["players"][pid] = respawn_player(pid)
-                        game_state["scores"][pid] = 0
-
-                # --- PHASE 3: HANDLING COUNTDOWN ---
-                elif game_state["status"] == "COUNTDOWN":
-                    elapsed = time.time() - game_state["timer_start"]
-                    if elapsed < 1: game_state["countdown"] = 3
-                    elif elapsed < 2: game_state["countdown"] = 2
-                    elif elapsed < 3: game_state["countdown"] = 1
-                    else: game_state["status"] = "RUNNING"
-
-                # --- PHASE 4: GAME OVER & RESTART ---
-                elif game_state["status"] == "GAME_OVER":
-                    # Wait 5 seconds, then restart
-                    if time.time() - game_state["timer_start"] > 5:
-                        game_state["status"] = "WAITING"
-                        game_state["winner"] = None
-                        game_state["scores"] = {pid: 0 for pid in game_state["players"]}
-
-                # --- PHASE 5: RUNNING LOGIC ---
-                if game_state["status"] == "RUNNING" and player_id in game_state["players"]:
-                    snake = game_state["players"][player_id]
-                    head_x, head_y = snake[-1]
-                    dx, dy = direction
-                    new_head = (head_x + dx * GRID_SIZE, head_y + dy * GRID_SIZE)
-
-                    # --- DEATH CONDITIONS ---
-                    died = False
-                    # 1. Wall Hit
-                    if not (0 <= new_head[0] < GAME_WIDTH and 0 <= new_head[1] < GAME_HEIGHT):
-                        died = True
-                        print(f"[{thread_name}] Player {player_id} hit wall.")
-
-                    # 2. Self/Enemy Collision
-                    # 2. Self/Enemy Collision
-                    # We use list() so we can modify the dictionary (kill enemies) while looping
-                    for other_pid, other_snake in list(game_state["players"].items()):
-                        if new_head in other_snake:
-                            
-                            # CASE A: You hit yourself (Suicide)
-                            if other_pid == player_id:
-                                died = True
-                                print(f"[{thread_name}] Player {player_id} committed suicide.")
-                            
-                            # CASE B: You hit an Enemy
-                            else:
-                                my_score = game_state["scores"].get(player_id, 0)
-                                enemy_score = game_state["scores"].get(other_pid, 0)
-
-                                if my_score > enemy_score:
-                                    # YOU WIN: You have more points.
-                                    # You survive, and the enemy is removed immediately.
-                                    print(f"[{thread_name}] P{player_id} ({my_score}) CRUSHED P{other_pid} ({enemy_score})!")
-                                    
-                                    # Kill the enemy immediately
-                                    if other_pid in game_state["players"]:
-                                        del game_state["players"][other_pid]
-                                    if other_pid in game_state["scores"]:
-                                        del game_state["scores"][other_pid]
-                                    
-                                    # IMPORTANT: Do not set died=True. You just walk through them.
-                                else:
-                                    # YOU LOSE: They have more (or equal) points.
-                                    died = True
-                                    print(f"[{thread_name}] Player {player_id} lost collision to Player {other_pid}.")
-
-                    if died:
-                        game_state["status"] = "GAME_OVER"
-                        game_state["timer_start"] = time.time() # Start 5s timer
-                        # Determine Winner (The one who didn't die)
-                        # Simplified: If P1 died, P2 wins.
-                        survivors = [p for p in game_state["players"] if p != player_id]
-                        if survivors:
-                            game_state["winner"] = survivors[0]
-                        else:
-                            game_state["winner"] = "Draw"
-                    else:
-                        # Move Logic
-                        if new_head == game_state["food"]:
-                            snake.append(new_head)
-                            game_state["food"] = generate_new_food()
-                            game_state["scores"][player_id] += 10
-                        else:
-                            snake.append(new_head)
-                            snake.pop(0)
-                        game_state["players"][player_id] = snake
-
-            send_data(conn, game_state)
+                frame = published_frame
+            send_frame(conn, frame)
             time.sleep(0.03)
 
     except Exception as e:
         print(f"[{thread_name}] Error: {e}")
     finally:
-        with state_lock:
-            if player_id in game_state["players"]: del game_state["players"][player_id]
-            if player_id in game_state["scores"]: del game_state["scores"][player_id]
-            if player_id in game_state["threads"]: del game_state["threads"][player_id]
-            if len(game_state["players"]) < 2:
-                game_state["status"] = "WAITING"
+        input_queue.put((player_id, "LEAVE", None))
         conn.close()
         print(f"[{thread_name}] Disconnected")
 
@@ -190,17 +231,12 @@ def start_server():
     server.bind((HOST, PORT))
     server.listen()
     print(f"SERVER STARTED on {HOST}:{PORT}")
+    threading.Thread(target=tick_loop, daemon=True).start()
     
     player_count = 0
     while True:
         conn, addr = server.accept()
         player_count += 1
-        
-        with state_lock:
-            game_state["players"][player_count] = respawn_player(player_count)
-            game_state["scores"][player_count] = 0
-            game_state["threads"][player_count] = "Connecting..."
-            
         threading.Thread(target=handle_client, args=(conn, player_count)).start()
 
 if __name__ == "__main__":
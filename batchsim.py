@@ -0,0 +1,244 @@
+import time
+import argparse
+
+import numpy as np
+
+import board
+
+# --- BATCHED SIMULATOR (offline bot training / evaluation) ---
+# Steps thousands of independent matches at once with NumPy arrays. Same
+# rules as the RUNNING phase of game_engine_process in server.py:
+#  * inputs persist until changed; (0,0) means stand still
+#  * reversing into the neck is ignored (the snake stops instead)
+#  * collisions are checked against the board BEFORE anyone moves; the first
+#    snake (in player order) that hits a wall ends the match as a Draw, the
+#    first that hits a body ends it with the body's owner as winner (own body = Draw)
+#  * the first snake onto the food grows, scores 10 and a new food spawns
+# There are no WAITING/COUNTDOWN phases: matches start RUNNING, and finished
+# matches can be reset in place (auto_reset) so the batch never idles.
+#
+# Not used by the server; needs numpy (pip install numpy).
+
+ACTIONS = np.array(board.DIRECTIONS + [(0, 0)], dtype=np.int32)  # 0-3 move, 4 stop
+KEEP = -1          # Action meaning "no new input this step"
+DRAW = -1
+NO_WINNER = -2
+FOOD_TRIES = 16
+
+
+class BatchSim:
+    def __init__(self, num_matches, num_snakes=2, board_w=board.DEFAULT_BOARD_W, board_h=board.DEFAULT_BOARD_H,
+                 max_len=256, seed=None):
+        self.B, self.S, self.L = num_matches, num_snakes, max_len
+        self.W, self.H = board.clamp_board_size(board_w, board_h)
+        self.rng = np.random.default_rng(seed)
+
+        B, S, L = self.B, self.S, self.L
+        # Bodies are ring buffers: segment i of a snake lives at (head_idx - i) % L
+        self.body = np.zeros((B, S, L, 2), np.int32)
+        self.head_idx = np.zeros((B, S), np.int32)
+        self.length = np.zeros((B, S), np.int32)
+        self.inputs = np.zeros((B, S, 2), np.int32)
+        self.occ = np.zeros((B, self.H, self.W), np.int16)   # snake index + 1, 0 = empty
+        self.food = np.zeros((B, 2), np.int32)
+        self.scores = np.zeros((B, S), np.int32)
+        self.done = np.zeros(B, bool)
+        self.winner = np.full(B, NO_WINNER, np.int32)
+        self.steps = np.zeros(B, np.int64)
+
+        self.total_steps = 0
+        self.matches_finished = 0
+        self._b = np.arange(B)[:, None]
+        self._s = np.arange(S)[None, :]
+        self.reset()
+
+    # --- SETUP ---
+    def reset(self, mask=None):
+        """Fresh 2-cell snakes (standing still) and food for the selected matches"""
+        idx = np.arange(self.B) if mask is None else np.flatnonzero(mask)
+        if idx.size == 0: return
+        self.occ[idx] = 0
+        self.body[idx] = 0
+        self.inputs[idx] = 0
+        self.scores[idx] = 0
+        self.done[idx] = False
+        self.winner[idx] = NO_WINNER
+        self.steps[idx] = 0
+        self.length[idx] = 2
+        self.head_idx[idx] = 1
+
+        # Same spawn area as board.random_spawn
+        mx, my = min(5, self.W // 4), min(5, self.H // 4)
+        pending = np.ones((idx.size, self.S), bool)
+        for attempt in range(100):
+            sx = self.rng.integers(mx, self.W - mx - 1, size=(idx.size, self.S))
+            sy = self.rng.integers(my, self.H - my, size=(idx.size, self.S))
+            # One snake slot at a time, so each placement sees the ones before it
+            for s in range(self.S):
+                rows = np.flatnonzero(pending[:, s])
+                if rows.size == 0: continue
+                b, x, y = idx[rows], sx[rows, s], sy[rows, s]
+                free = (self.occ[b, y, x] == 0) & (self.occ[b, y, x + 1] == 0)
+                if attempt == 99: free[:] = True  # Crowded board: take it anyway
+                b, x, y = b[free], x[free], y[free]
+                self.body[b, s, 0, 0], self.body[b, s, 0, 1] = x, y
+                self.body[b, s, 1, 0], self.body[b, s, 1, 1] = x + 1, y
+                self.occ[b, y, x] = s + 1
+                self.occ[b, y, x + 1] = s + 1
+                pending[rows[free], s] = False
+            if not pending.any(): break
+        self._new_food(idx)
+
+    def _new_food(self, idx):
+        """Random free cell away from the walls (like board.random_food)"""
+        n = idx.size
+        xs = self.rng.integers(2, self.W - 2, size=(n, FOOD_TRIES))
+        ys = self.rng.integers(2, self.H - 2, size=(n, FOOD_TRIES))
+        free = self.occ[idx[:, None], ys, xs] == 0
+        pick = np.where(free.any(axis=1), free.argmax(axis=1), FOOD_TRIES - 1)
+        rows = np.arange(n)
+        self.food[idx, 0] = xs[rows, pick]
+        self.food[idx, 1] = ys[rows, pick]
+
+    # --- SIMULATION ---
+    def heads(self):
+        return self.body[self._b, self._s, self.head_idx]
+
+    def step(self, actions=None, auto_reset=True):
+        """actions: (B, S) ints, 0-3 = board.DIRECTIONS, 4 = stop, KEEP = no change.
+        Returns a mask of the matches that ended on this step."""
+        if actions is not None:
+            actions = np.asarray(actions)
+            given = actions >= 0
+            self.inputs[given] = ACTIONS[actions[given]]
+
+        active = ~self.done
+        head = self.heads()
+        neck = self.body[self._b, self._s, (self.head_idx - 1) % self.L]
+
+        # --- NECK CHECK (reverse into the neck -> stand still) ---
+        d = self.inputs.copy()
+        reverse = (self.length > 1) & np.all(head + d == neck, axis=-1)
+        d[reverse] = 0
+        moving = np.any(d != 0, axis=-1) & active[:, None]
+
+        new_head = head + d
+        nx, ny = new_head[..., 0], new_head[..., 1]
+        inside = (nx >= 0) & (nx < self.W) & (ny >= 0) & (ny < self.H)
+
+        # --- COLLISIONS (against the board before anyone moves) ---
+        owner = self.occ[self._b, np.clip(ny, 0, self.H - 1), np.clip(nx, 0, self.W - 1)].astype(np.int32) - 1
+        wall = moving & ~inside
+        # A standing snake only "hits" when its head cell is marked as someone else's
+        # (two heads can share a cell after moving into it on the same tick)
+        crash = wall | (active[:, None] & inside & (owner >= 0) & (moving | (owner != self._s)))
+        crashed = crash.any(axis=1)
+        ended = np.flatnonzero(crashed)
+        if ended.size:
+            first = crash[ended].argmax(axis=1)      # Player order, like the engine's dict order
+            hit_owner = owner[ended, first]
+            self.winner[ended] = np.where(wall[ended, first] | (hit_owner == first), DRAW, hit_owner)
+            self.done[ended] = True
+
+        # --- APPLY MOVES (matches without a collision) ---
+        bi, si = np.nonzero(moving & ~crashed[:, None])
+        if bi.size:
+            hx, hy = nx[bi, si], ny[bi, si]
+
+            # Only the first snake onto the food eats it (the engine respawns food at once)
+            on_food = (hx == self.food[bi, 0]) & (hy == self.food[bi, 1]) & (self.length[bi, si] < self.L)
+            food_rows = np.flatnonzero(on_food)
+            eats = np.zeros(bi.size, bool)
+            if food_rows.size:
+                _, first_eater = np.unique(bi[food_rows], return_index=True)
+                eats[food_rows[first_eater]] = True
+
+            new_idx = (self.head_idx[bi, si] + 1) % self.L
+            self.head_idx[bi, si] = new_idx
+            self.body[bi, si, new_idx, 0] = hx
+            self.body[bi, si, new_idx, 1] = hy
+            self.occ[bi, hy, hx] = si + 1
+
+            # Tails: everyone who didn't eat drops their last segment
+            tb, ts = bi[~eats], si[~eats]
+            tail_idx = (self.head_idx[tb, ts] - self.length[tb, ts]) % self.L
+            tx, ty = self.body[tb, ts, tail_idx, 0], self.body[tb, ts, tail_idx, 1]
+            mine = self.occ[tb, ty, tx] == ts + 1
+            self.occ[tb[mine], ty[mine], tx[mine]] = 0
+
+            eb, es = bi[eats], si[eats]
+            self.length[eb, es] += 1
+            self.scores[eb, es] += 10
+            if eb.size: self._new_food(np.unique(eb))
+
+        self.steps[active] += 1
+        self.total_steps += int(active.sum())
+        self.matches_finished += ended.size
+        if auto_reset and ended.size:
+            self.reset(crashed)
+        return crashed
+
+    # --- EXPORT ---
+    def match_state(self, b):
+        """One match in the engine's dict shape, for dict-based bots and the client"""
+        players = {}
+        for s in range(self.S):
+            n = self.length[b, s]
+            idx = (self.head_idx[b, s] - np.arange(n - 1, -1, -1)) % self.L
+            players[s + 1] = [tuple(int(v) for v in cell) for cell in self.body[b, s, idx]]
+        winner = int(self.winner[b])
+        return {
+            "players": players,
+            "scores": {s + 1: int(self.scores[b, s]) for s in range(self.S)},
+            "food": (int(self.food[b, 0]), int(self.food[b, 1])),
+            "board_w": self.W,
+            "board_h": self.H,
+            "status": "GAME_OVER" if self.done[b] else "RUNNING",
+            "winner": None if winner == NO_WINNER else ("Draw" if winner == DRAW else winner + 1),
+        }
+
+
+# --- POLICIES ---
+def random_policy(sim):
+    return sim.rng.integers(0, 4, size=(sim.B, sim.S))
+
+def greedy_policy(sim):
+    """Heads toward the food, never into a wall or body if a safe move exists"""
+    head = sim.heads()
+    cand = head[:, :, None, :] + ACTIONS[None, None, :4, :]          # (B, S, 4, 2)
+    cx, cy = cand[..., 0], cand[..., 1]
+    inside = (cx >= 0) & (cx < sim.W) & (cy >= 0) & (cy < sim.H)
+    occupied = sim.occ[sim._b[:, :, None], np.clip(cy, 0, sim.H - 1), np.clip(cx, 0, sim.W - 1)] != 0
+    dist = np.abs(cx - sim.food[:, None, None, 0]) + np.abs(cy - sim.food[:, None, None, 1])
+    return np.where(inside & ~occupied, dist, 1 << 20).argmin(axis=-1)
+
+POLICIES = {"random": random_policy, "greedy": greedy_policy}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched snake simulator benchmark")
+    parser.add_argument("--matches", type=int, default=4096)
+    parser.add_argument("--snakes", type=int, default=2)
+    parser.add_argument("--board", default="50x50", help="Board size in cells, WxH")
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    board_w, board_h = board.parse_board_size(args.board)
+    sim = BatchSim(args.matches, args.snakes, board_w, board_h, seed=args.seed)
+    policy = POLICIES[args.policy]
+    draws = wins = 0
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        ended = sim.step(policy(sim), auto_reset=False)
+        if ended.any():
+            draws += int((sim.winner[ended] == DRAW).sum())
+            wins += int((sim.winner[ended] >= 0).sum())
+            sim.reset(ended)
+    elapsed = time.perf_counter() - start
+
+    rate = sim.total_steps / elapsed
+    print(f"{args.matches} matches x {args.steps} steps ({args.policy}, {board_w}x{board_h}, {args.snakes} snakes)")
+    print(f"  {rate:,.0f} match-steps/s  ({rate * 60 / 1e6:,.1f}M per minute)")
+    print(f"  finished={sim.matches_finished} wins={wins} draws={draws} mean score now={sim.scores.mean():.1f}")
@@ -0,0 +1,54 @@
+import random
+
+# --- BOARD CONFIGURATION ---
+# Everything in the engine is measured in CELLS (integer grid indices).
+# Pixels only exist on the client, which scales the board to its screen.
+DEFAULT_BOARD_W = 50
+DEFAULT_BOARD_H = 50
+MIN_BOARD_SIZE = 10
+MAX_BOARD_SIZE = 1000
+
+# Directions a snake can take, as (dx, dy) cell steps
+DIRECTIONS = [(0, -1), (0, 1), (-1, 0), (1, 0)]
+
+
+def clamp_board_size(board_w, board_h):
+    """Keeps requested dimensions inside the supported range"""
+    board_w = max(MIN_BOARD_SIZE, min(MAX_BOARD_SIZE, int(board_w)))
+    board_h = max(MIN_BOARD_SIZE, min(MAX_BOARD_SIZE, int(board_h)))
+    return board_w, board_h
+
+
+def parse_board_size(text):
+    """Parses "WxH" (e.g. "500x500") into a clamped (w, h) tuple"""
+    w, h = text.lower().split("x")
+    return clamp_board_size(w, h)
+
+
+def in_bounds(cell, board_w, board_h):
+    return 0 <= cell[0] < board_w and 0 <= cell[1] < board_h
+
+
+def random_spawn(board_w, board_h, occupied=None):
+    """Returns a fresh 2-cell snake [tail, head] on a free spot"""
+    margin_x = min(5, board_w // 4)
+    margin_y = min(5, board_h // 4)
+    sx, sy = margin_x, margin_y
+    # Random tries are cheap; on a crowded board we give up and take the last one
+    for _ in range(100):
+        sx = random.randint(margin_x, board_w - margin_x - 2)
+        sy = random.randint(margin_y, board_h - margin_y - 1)
+        if not occupied or ((sx, sy) not in occupied and (sx + 1, sy) not in occupied):
+            break
+    return [(sx, sy), (sx + 1, sy)]
+
+
+def random_food(board_w, board_h, occupied=None):
+    """Returns a random free cell for the food, away from the walls"""
+    x, y = 2, 2
+    for _ in range(100):
+        x = random.randint(2, board_w - 3)
+        y = random.randint(2, board_h - 3)
+        if not occupied or (x, y) not in occupied:
+            break
+    return (x, y)
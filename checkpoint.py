@@ -0,0 +1,69 @@
+import threading
+
+import metrics
+import gamestate
+
+# --- ENGINE CHECKPOINTS ---
+# The engine already publishes the whole world to the shared dict every tick
+# (game_state: snakes, scores, food, phase, timers, tick, input acks). All it
+# keeps to itself is small: each player's current direction and a pending
+# board resize. The tick loop hands that to a writer thread (newest wins,
+# the tick never waits on the Manager), so a restarted engine can carry on
+# from game_state + checkpoint. See EngineSupervisor in server.py.
+
+
+def capture(match, pending_board):
+    return {
+        "tick": match.tick,
+        "directions": {pid: p.direction for pid, p in match.players.items()},
+        "pending_board": pending_board,
+    }
+
+def restore(state, checkpoint):
+    """(Match, pending_board) rebuilt from the last published state and checkpoint"""
+    match = gamestate.Match.from_snapshot(state)
+    checkpoint = checkpoint or {}
+    for pid, direction in checkpoint.get("directions", {}).items():
+        if pid in match.players: match.players[pid].direction = direction
+    return match, checkpoint.get("pending_board")
+
+def rejoin(state, board_w, board_h):
+    """A fresh match for when restoring keeps crashing: new snakes and scores on
+    a fresh board, but the same players and game mode, so nobody connected is
+    left watching a match they're no longer in"""
+    match = gamestate.Match(board_w, board_h)
+    match.game_mode = state.get("game_mode", match.game_mode)
+    occupied = {}
+    for pid in state.get("players", {}):
+        for segment in match.spawn(pid, occupied).snake.body: occupied[segment] = pid
+    return match
+
+
+class Checkpointer:
+    """Engine side: offer() from the tick loop, a daemon thread does the Manager write"""
+
+    def __init__(self, shared_return_dict, key):
+        self.shared = shared_return_dict
+        self.key = key
+        self.pending = None
+        self.ready = threading.Condition()
+        threading.Thread(target=self._write_loop, name="checkpoint", daemon=True).start()
+
+    def offer(self, checkpoint):
+        with self.ready:
+            if self.pending is not None: metrics.inc("checkpoints_superseded")
+            self.pending = checkpoint
+            self.ready.notify()
+
+    def _write_loop(self):
+        while True:
+            with self.ready:
+                while self.pending is None:
+                    self.ready.wait()
+                checkpoint, self.pending = self.pending, None
+            try:
+                with metrics.timer("checkpoint_write_ms"):
+                    self.shared[self.key] = checkpoint
+                metrics.inc("checkpoints_written")
+            except Exception as e:
+                print(f"[ENGINE] Checkpoint Error: {e}")
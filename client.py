@@ -3,6 +3,13 @@ import socket
 import pickle
 import struct
 import os
+import time
+import hashlib
+
+import framecodec
+import gamestate
+import latency
+import telemetry
 
 # --- CONNECTIVITY ---
 # CHANGE THIS: Use "127.0.0.1" for local testing
@@ -10,6 +17,17 @@ import os
 HOST = "127.0.0.1" 
 PORT = 5555
 
+# Watch-only mode: point PORT at a relay (5558) or the server's spectator stream (5557)
+SPECTATE = False
+SPECTATE_SHARD = 0          # Which match to watch on the server (relays have picked already)
+
+# Ask the server to zlib-compress large frames (see framecodec.py)
+COMPRESSION = True
+
+# "TCP" or "UDP" (UDP needs the server started with --udp-port 5560)
+TRANSPORT = "TCP"
+UDP_PORT = 5560
+
 # --- VISUAL CONFIGURATION ---
 TARGET_PHONE_HEIGHT = 900  
 DEBUG_MODE = False          # Set to False to hide the red box
@@ -33,9 +51,75 @@ RED = (255, 50, 50)
 YELLOW = (255, 255, 0)
 
 # --- GAME CONSTANTS ---
+# The virtual LCD is always 1000x1000; the board size (in cells) comes from the server
 LOGICAL_WIDTH = 1000
 LOGICAL_HEIGHT = 1000
-GRID_SIZE = 20
+DEFAULT_BOARD_W = 50
+DEFAULT_BOARD_H = 50
+
+# --- ASSET CACHE ---
+# Scaling the 500 KB bezel PNG with smoothscale dominates startup. The result
+# is saved once as raw RGBA under ASSET_CACHE_DIR, keyed on the source file's
+# hash and the target size, and loaded straight from there afterwards. A new
+# image or a new TARGET_PHONE_HEIGHT simply misses the cache.
+ASSET_CACHE_DIR = ".asset_cache"
+CACHE_HEADER = struct.Struct(">II")   # width, height
+
+_image_to_bytes = getattr(pygame.image, "tobytes", None) or pygame.image.tostring
+_image_from_bytes = getattr(pygame.image, "frombytes", None) or pygame.image.fromstring
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+def cached_surface(name, source_path, size_key, build):
+    """build() -> Surface, run only when there's no cached copy for this source + size.
+    Returns (surface, came_from_cache)."""
+    cache_path = os.path.join(ASSET_CACHE_DIR, f"{name}-{file_digest(source_path)}-{size_key}.rgba")
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+        w, h = CACHE_HEADER.unpack_from(data)
+        return _image_from_bytes(data[CACHE_HEADER.size:], (w, h), "RGBA"), True
+    except (OSError, ValueError, struct.error):
+        pass
+
+    surface = build()
+    try:
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        with open(cache_path + ".tmp", "wb") as f:
+            f.write(CACHE_HEADER.pack(*surface.get_size()))
+            f.write(_image_to_bytes(surface, "RGBA"))
+        # Rename is atomic, so a second client starting up never reads half a file
+        os.replace(cache_path + ".tmp", cache_path)
+    except OSError as e:
+        print(f"Asset cache not written: {e}")
+    return surface, False
+
+def load_scaled_image(path, target_h):
+    """The image at path, smoothscaled to target_h pixels tall (aspect kept)"""
+    def build():
+        raw_img = pygame.image.load(path)
+        raw_w, raw_h = raw_img.get_size()
+        scale_factor = target_h / raw_h
+        return pygame.transform.smoothscale(raw_img, (int(raw_w * scale_factor), int(raw_h * scale_factor)))
+    return cached_surface("bezel", path, f"h{target_h}", build)
+
+
+class LazyFont:
+    """Stands in for pygame.font.Font. SysFont is slow the first time (it scans
+    the installed fonts), so the real font is only made when first drawn with."""
+
+    def __init__(self, name, size, bold=False):
+        self.args = (name, size, bold)
+        self.font = None
+
+    def __getattr__(self, attr):
+        if self.font is None:
+            name, size, bold = self.args
+            self.font = pygame.font.SysFont(name, size, bold=bold)
+        return getattr(self.font, attr)
+
 
 def send_data(sock, data):
     try:
@@ -47,31 +131,43 @@ def receive_data(sock):
     try:
         header = sock.recv(4)
         if not header: return None
-        msg_len = struct.unpack('>I', header)[0]
+        length_word = struct.unpack('>I', header)[0]
+        msg_len = length_word & framecodec.LENGTH_MASK
         data = b""
         while len(data) < msg_len:
             packet = sock.recv(msg_len - len(data))
             if not packet: return None
             data += packet
+        if length_word & framecodec.COMPRESS_FLAG:
+            data = framecodec.decompress(data)
         return pickle.loads(data)
     except: return None
 
-def draw_nokia_game(surface, game_state, font_main, font_huge):
+def draw_nokia_game(surface, match, font_main, font_huge):
     """Draws the game logic onto the virtual Nokia screen surface"""
     surface.fill(NOKIA_GREEN)
     
-    status = game_state.get("status", "WAITING")
-
-    # Draw Food
-    if status in ["RUNNING", "COUNTDOWN"]:
-        fx, fy = game_state["food"]
+    status = match.status
+
+    # Cell size in LCD pixels. The server sends the window (in cells) we are looking at;
+    # older servers only send the board size, which means the whole board is visible.
+    view_x, view_y, view_w, view_h = match.viewport or (0, 0, match.board_w, match.board_h)
+    cell_w = LOGICAL_WIDTH / view_w
+    cell_h = LOGICAL_HEIGHT / view_h
+    size_w, size_h = max(1, int(cell_w)), max(1, int(cell_h))
+    outline = max(1, int(cell_w * 0.15))
+
+    # Draw Food (None when it is outside our viewport)
+    if status in ["RUNNING", "COUNTDOWN"] and match.food:
+        fx, fy = (match.food[0] - view_x) * cell_w, (match.food[1] - view_y) * cell_h
         # Food is a small solid block + outline
-        pygame.draw.rect(surface, NOKIA_DARK, (fx + 4, fy + 4, GRID_SIZE - 8, GRID_SIZE - 8))
-        pygame.draw.rect(surface, NOKIA_DARK, (fx, fy, GRID_SIZE, GRID_SIZE), 1)
+        pygame.draw.rect(surface, NOKIA_DARK, (fx + cell_w * 0.2, fy + cell_h * 0.2, max(1, int(cell_w * 0.6)), max(1, int(cell_h * 0.6))))
+        pygame.draw.rect(surface, NOKIA_DARK, (fx, fy, size_w, size_h), 1)
 
     # Draw Snakes
     if status in ["RUNNING", "COUNTDOWN", "GAME_OVER"]:
-        for pid, snake in game_state["players"].items():
+        for pid, player in match.players.items():
+            snake = player.snake.body
             
             # --- VISUAL DISTINCTION LOGIC ---
             # Player 1 (Odd IDs) = Solid Snake
@@ -79,7 +175,8 @@ def draw_nokia_game(surface, game_state, font_main, font_huge):
             is_solid = (pid % 2 != 0) 
 
             for i, segment in enumerate(snake):
-                rect = (segment[0], segment[1], GRID_SIZE, GRID_SIZE)
+                sx, sy = (segment[0] - view_x) * cell_w, (segment[1] - view_y) * cell_h
+                rect = (sx, sy, size_w, size_h)
                 
                 if is_solid:
                     # DRAW SOLID SNAKE (P1)
@@ -89,10 +186,10 @@ def draw_nokia_game(surface, game_state, font_main, font_huge):
                 else:
                     # DRAW HOLLOW SNAKE (P2)
                     # Thick outline
-                    pygame.draw.rect(surface, NOKIA_DARK, rect, 3)
+                    pygame.draw.rect(surface, NOKIA_DARK, rect, outline)
                     # If it's the head, put a dot in the middle
                     if i == len(snake) - 1:
-                        pygame.draw.rect(surface, NOKIA_DARK, (segment[0]+6, segment[1]+6, 8, 8))
+                        pygame.draw.rect(surface, NOKIA_DARK, (sx + cell_w * 0.3, sy + cell_h * 0.3, max(1, int(cell_w * 0.4)), max(1, int(cell_h * 0.4))))
 
     # UI Text Logic
     if status == "WAITING":
@@ -101,21 +198,21 @@ def draw_nokia_game(surface, game_state, font_main, font_huge):
         surface.blit(txt1, (LOGICAL_WIDTH//2 - txt1.get_width()//2, LOGICAL_HEIGHT//2 - 60))
         surface.blit(txt2, (LOGICAL_WIDTH//2 - txt2.get_width()//2, LOGICAL_HEIGHT//2 + 10))
         
-        if game_state["players"]:
+        if match.players:
             try:
-                my_id = list(game_state["players"].keys())[-1]
+                my_id = match.you or list(match.players.keys())[-1]
                 sub = font_main.render(f"YOU: P{my_id}", True, NOKIA_DARK)
                 surface.blit(sub, (LOGICAL_WIDTH//2 - sub.get_width()//2, LOGICAL_HEIGHT//2 + 80))
             except: pass
     
     elif status == "COUNTDOWN":
-        count_val = str(game_state.get("countdown", 3))
+        count_val = str(match.countdown)
         txt = font_huge.render(count_val, True, NOKIA_DARK)
         rect = txt.get_rect(center=(LOGICAL_WIDTH//2, LOGICAL_HEIGHT//2))
         surface.blit(txt, rect)
 
     elif status == "GAME_OVER":
-        winner = game_state.get("winner", "Unknown")
+        winner = match.winner
         
         if winner == "Draw":
             msg = "DRAW GAME"
@@ -125,7 +222,7 @@ def draw_nokia_game(surface, game_state, font_main, font_huge):
         txt = font_main.render(msg, True, NOKIA_DARK)
         surface.blit(txt, (LOGICAL_WIDTH//2 - txt.get_width()//2, LOGICAL_HEIGHT//2))
 
-def draw_dashboard(screen, x_offset, height, game_state, font_title, font_body):
+def draw_dashboard(screen, x_offset, height, match, font_title, font_body, lag=None):
     """Draws the detailed System Monitor"""
     MENU_WIDTH = 300
     menu_rect = pygame.Rect(x_offset, 0, MENU_WIDTH, height)
@@ -138,7 +235,7 @@ def draw_dashboard(screen, x_offset, height, game_state, font_title, font_body):
 
     y_pos = 60
     # Status
-    status_text = f"Status: {game_state.get('status', 'Unknown')}"
+    status_text = f"Status: {match.status}"
     screen.blit(font_body.render(status_text, True, WHITE), (x_offset + 15, y_pos))
     y_pos += 40
 
@@ -146,7 +243,7 @@ def draw_dashboard(screen, x_offset, height, game_state, font_title, font_body):
     screen.blit(font_body.render("Active Processes (PIDs):", True, WHITE), (x_offset + 15, y_pos))
     y_pos += 25
 
-    debug_info = game_state.get("debug_info", {})
+    debug_info = match.debug_info
     
     # Server PID
     s_pid = debug_info.get("server_pid", "???")
@@ -164,19 +261,35 @@ def draw_dashboard(screen, x_offset, height, game_state, font_title, font_body):
     y_pos += 30
 
     # AI Stats
-    screen.blit(font_body.render("AI Nodes Searched:", True, WHITE), (x_offset + 15, y_pos))
+    screen.blit(font_body.render("AI Search (nodes / depth):", True, WHITE), (x_offset + 15, y_pos))
+    y_pos += 20
+    cycles = debug_info.get("compute_cycles") or {}
+    search_text = f"{cycles.get('nodes', 0):,} / {cycles.get('depth', 0)}"
+    screen.blit(font_body.render(search_text, True, YELLOW), (x_offset + 15, y_pos))
+    y_pos += 20
+    screen.blit(font_body.render(f"{cycles.get('nodes_per_sec', 0):,} nodes/s", True, YELLOW), (x_offset + 15, y_pos))
+    y_pos += 30
+
+    # Latency (see latency.py); "--" until the first pong / acked keypress
+    if lag:
+        ms = lambda value, sign="": "--" if value is None else f"{value:{sign}.0f} ms"
+        screen.blit(font_body.render("Latency:", True, WHITE), (x_offset + 15, y_pos))
+        y_pos += 20
+        screen.blit(font_body.render(f"RTT {ms(lag.rtt_ms)}  clock {ms(lag.offset_ms, '+')}", True, YELLOW), (x_offset + 15, y_pos))
+        y_pos += 20
+        screen.blit(font_body.render(f"Key->screen {ms(lag.input_ms)}", True, YELLOW), (x_offset + 15, y_pos))
+        y_pos += 20
+        screen.blit(font_body.render(f"Key->engine {ms(lag.uplink_ms)}  tick {lag.tick or '--'}", True, YELLOW), (x_offset + 15, y_pos))
+        y_pos += 20
     y_pos += 20
-    cycles = debug_info.get("compute_cycles", 0)
-    screen.blit(font_body.render(f"{cycles:,}", True, YELLOW), (x_offset + 15, y_pos))
-    y_pos += 40
 
     # Player Scores
     screen.blit(font_body.render("Player Scores:", True, WHITE), (x_offset + 15, y_pos))
     y_pos += 25
 
-    for pid, score in game_state.get("scores", {}).items():
+    for pid, player in match.players.items():
         color = GREEN if pid % 2 != 0 else BLUE
-        p_text = font_body.render(f"P{pid}: {score}", True, color)
+        p_text = font_body.render(f"P{pid}: {player.score}", True, color)
         screen.blit(p_text, (x_offset + 15, y_pos))
         y_pos += 20
 
@@ -207,39 +320,19 @@ def draw_menu(screen, font_title, font_body):
         pygame.time.wait(50)
 
 def main():
+    start_time = time.perf_counter()
     pygame.init()
     
-    # 1. LOAD IMAGE
+    # 1. LOAD IMAGE (scaled once, then straight from the asset cache)
     img_path = "nokiainterface.jpg"
     if not os.path.exists(img_path):
         img_path = "nokiainterface.png" 
 
     try:
-        raw_img = pygame.image.load(img_path)
-        raw_w, raw_h = raw_img.get_size()
-        scale_factor = TARGET_PHONE_HEIGHT / raw_h
-        new_w, new_h = int(raw_w * scale_factor), int(raw_h * scale_factor)
-        phone_img = pygame.transform.smoothscale(raw_img, (new_w, new_h))
-    except:
-        new_w, new_h = 500, 900
-        phone_img = pygame.Surface((new_w, new_h))
-        phone_img.fill((50,50,50))
-
-def main():
-    pygame.init()
-    
-    # 1. LOAD IMAGE
-    img_path = "nokiainterface.jpg"
-    if not os.path.exists(img_path):
-        img_path = "nokiainterface.png" 
-
-    try:
-        raw_img = pygame.image.load(img_path)
-        raw_w, raw_h = raw_img.get_size()
-        scale_factor = TARGET_PHONE_HEIGHT / raw_h
-        new_w, new_h = int(raw_w * scale_factor), int(raw_h * scale_factor)
-        phone_img = pygame.transform.smoothscale(raw_img, (new_w, new_h))
+        phone_img, cached = load_scaled_image(img_path, TARGET_PHONE_HEIGHT)
+        new_w, new_h = phone_img.get_size()
     except:
+        cached = False
         new_w, new_h = 500, 900
         phone_img = pygame.Surface((new_w, new_h))
         phone_img.fill((50,50,50))
@@ -255,35 +348,56 @@ def main():
 
     screen = pygame.display.set_mode((TOTAL_WIDTH, TOTAL_HEIGHT))
     pygame.display.set_caption("Parallel Snake - Nokia Edition")
+    phone_img = phone_img.convert_alpha() # Display format: the bezel is blitted every frame
     
     virtual_lcd = pygame.surface.Surface((LOGICAL_WIDTH, LOGICAL_HEIGHT))
 
-    # Fonts
-    font_nokia_main = pygame.font.SysFont("Consolas", 60, bold=True)
-    font_nokia_huge = pygame.font.SysFont("Consolas", 120, bold=True)
-    font_dash_title = pygame.font.SysFont("Consolas", 22, bold=True)
-    font_dash_body = pygame.font.SysFont("Consolas", 16)
+    # Fonts (built on first use: the menu only needs one of them)
+    font_nokia_main = LazyFont("Consolas", 60, bold=True)
+    font_nokia_huge = LazyFont("Consolas", 120, bold=True)
+    font_dash_title = LazyFont("Consolas", 22, bold=True)
+    font_dash_body = LazyFont("Consolas", 16)
 
     # Networking
-    try:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((HOST, PORT))
-    except:
-        print("Server not found. Running in visual mode.")
-        client_socket = None
+    udp_session = None
+    client_socket = None
+    if TRANSPORT == "UDP" and not SPECTATE:
+        from udp_transport import UdpClientSession
+        udp_session = UdpClientSession(HOST, UDP_PORT)
+    else:
+        try:
+            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            client_socket.connect((HOST, PORT))
+            if COMPRESSION and not SPECTATE:
+                send_data(client_socket, f"CODEC:{framecodec.CODEC_NAME}")
+            if SPECTATE:
+                client_socket.sendall(f"SHARD:{SPECTATE_SHARD}\n".encode())   # A line, not a frame
+        except:
+            print("Server not found. Running in visual mode.")
+            client_socket = None
 
     # --- SHOW MENU ---
-    selected_mode = draw_menu(screen, font_nokia_main, font_nokia_main)
-    if not selected_mode: return # User closed window
-    
-    if client_socket:
-        send_data(client_socket, f"MODE:{selected_mode}")
-
+    if not SPECTATE:
+        print(f"Menu up in {(time.perf_counter() - start_time) * 1000:.0f} ms (bezel {'from cache' if cached else 'scaled'})")
+        selected_mode = draw_menu(screen, font_nokia_main, font_nokia_main)
+        if not selected_mode: return # User closed window
+        
+        if client_socket:
+            send_data(client_socket, f"MODE:{selected_mode}")
+            send_data(client_socket, telemetry.SUBSCRIBE)
+        if udp_session:
+            udp_session.send_input(f"MODE:{selected_mode}")
+            udp_session.send_input(telemetry.SUBSCRIBE)
+
+    lag = latency.ClientLatency()
+    dashboard_info = {}   # Telemetry arrives about once a second; keep the last copy
     clock = pygame.time.Clock()
     current_direction = (1, 0) # Default starting direction
+    last_sent_direction = None
+    last_status = None
     running = True
     
-    game_state = {"status": "WAITING", "threads": {}, "players": {}, "food": (100,100), "scores": {}}
+    match = gamestate.Match(DEFAULT_BOARD_W, DEFAULT_BOARD_H)
 
     while running:
         for event in pygame.event.get():
@@ -297,15 +411,38 @@ def main():
 
         # Network update
         if client_socket:
-            send_data(client_socket, current_direction)
+            if not SPECTATE:
+                send_data(client_socket, lag.move(current_direction))
+                ping = lag.ping()
+                if ping: send_data(client_socket, ping)
             new_state = receive_data(client_socket)
-            if new_state: game_state = new_state
+            if new_state:
+                lag.on_frame(new_state)
+                dashboard_info = new_state.get("telemetry", dashboard_info)
+                match = gamestate.Match.from_snapshot(new_state)
+                match.debug_info = dashboard_info
+        elif udp_session:
+            # Only changes are queued; they are resent every frame until acked.
+            # The engine stops everyone on a new round, so re-send on status changes too.
+            status = match.status
+            if current_direction != last_sent_direction or status != last_status:
+                udp_session.send_input(lag.move(current_direction))
+                last_sent_direction, last_status = current_direction, status
+            ping = lag.ping()
+            if ping: udp_session.send_input(ping)
+            udp_session.flush()
+            new_state = udp_session.poll()
+            if new_state:
+                lag.on_frame(new_state)
+                dashboard_info = new_state.get("telemetry", dashboard_info)
+                match = gamestate.Match.from_snapshot(new_state)
+                match.debug_info = dashboard_info
 
         # --- DRAWING ---
         screen.fill(BLACK) 
         screen.blit(phone_img, (0, 0))
 
-        draw_nokia_game(virtual_lcd, game_state, font_nokia_main, font_nokia_huge)
+        draw_nokia_game(virtual_lcd, match, font_nokia_main, font_nokia_huge)
         
         scaled_game = pygame.transform.scale(virtual_lcd, (VIRTUAL_SCREEN_W, VIRTUAL_SCREEN_H))
         screen.blit(scaled_game, (screen_x, screen_y))
@@ -313,7 +450,7 @@ def main():
         if DEBUG_MODE:
             pygame.draw.rect(screen, RED, (screen_x, screen_y, VIRTUAL_SCREEN_W, VIRTUAL_SCREEN_H), 2)
 
-        draw_dashboard(screen, new_w, TOTAL_HEIGHT, game_state, font_dash_title, font_dash_body)
+        draw_dashboard(screen, new_w, TOTAL_HEIGHT, match, font_dash_title, font_dash_body, None if SPECTATE else lag)
 
         pygame.display.flip()
         clock.tick(30)
@@ -0,0 +1,333 @@
+import socket
+import selectors
+import threading
+import pickle
+import struct
+import time
+from collections import deque
+
+import metrics
+import framecodec
+
+# --- OUTPUT BACKPRESSURE ---
+# Every client gets a tiny outbox. New frames push old ones out (the newest
+# state is the only one worth sending), a writer thread drains it with a
+# write timeout, and a client that keeps falling behind is evicted.
+SEND_QUEUE_FRAMES = 2      # Frames buffered per client before dropping the oldest
+FRAME_RATE = 20            # Frames/sec the server pushes to each client
+WRITE_TIMEOUT = 2.0        # Seconds a single frame may take to send
+# Consecutive dropped frames before eviction: half the write timeout's worth
+# (~1s at 20Hz), so a stalled reader is caught before the write timeout fires
+EVICT_AFTER_DROPS = int(FRAME_RATE * WRITE_TIMEOUT / 2)
+
+
+class ClientConnection:
+    """One client's socket plus its bounded send queue and counters"""
+
+    def __init__(self, conn, pid):
+        self.conn = conn
+        self.pid = pid
+        self.compress = False   # Set once the client negotiates CODEC:<framecodec.CODEC_NAME>
+        self.outbox = deque(maxlen=SEND_QUEUE_FRAMES)
+        self.ready = threading.Condition()
+        self.alive = True
+        self.close_reason = None
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.drop_streak = 0
+        # Timeout is for writes; reads (see recv_exact) just keep waiting
+        conn.settimeout(WRITE_TIMEOUT)
+
+    def push(self, frame):
+        """Queues a frame without ever blocking the caller"""
+        if not self.alive: return
+        with self.ready:
+            if len(self.outbox) == self.outbox.maxlen:
+                # Oldest frame is stale: deque(maxlen) drops it for us
+                self.frames_dropped += 1
+                self.drop_streak += 1
+                metrics.inc("net_frames_dropped", client=self.pid)
+            self.outbox.append(frame)
+            self.ready.notify()
+        if self.drop_streak >= EVICT_AFTER_DROPS:
+            self.close(f"fell {self.drop_streak} frames behind")
+
+    def close(self, reason):
+        if not self.alive: return
+        self.alive = False
+        self.close_reason = reason
+        if not reason.startswith("input closed"):
+            metrics.inc("net_clients_evicted")
+        metrics.forget("client", self.pid)
+        with self.ready:
+            self.outbox.clear()
+            self.ready.notify()
+        # Shutdown wakes the input thread blocked in recv, so nothing lingers
+        try: self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError: pass
+        try: self.conn.close()
+        except OSError: pass
+        print(f"[NET] Player {self.pid} closed: {reason} (sent={self.frames_sent}, dropped={self.frames_dropped})")
+
+    def writer_loop(self):
+        """Runs in the client's output thread: sends queued frames until the client dies"""
+        while self.alive:
+            with self.ready:
+                while self.alive and not self.outbox:
+                    self.ready.wait()
+                if not self.alive: return
+                frame = self.outbox.popleft()
+            try:
+                start = time.perf_counter()
+                payload = encode_frame(frame, self.compress)
+                metrics.observe("net_serialize_ms", (time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                self.conn.sendall(payload)
+                metrics.observe("net_send_ms", (time.perf_counter() - start) * 1000)
+            except socket.timeout:
+                self.close(f"write timed out after {WRITE_TIMEOUT}s")
+                return
+            except OSError as e:
+                self.close(f"send failed ({e})")
+                return
+            self.frames_sent += 1
+            self.drop_streak = 0
+            metrics.inc("net_client_bytes_sent", len(payload), client=self.pid)
+            metrics.inc("net_bytes_sent", len(payload))
+            metrics.inc("net_frames_sent")
+
+
+def encode_frame(data, compress=False, stream="tcp"):
+    """Length-prefixed pickle, ready for sendall. The top bit of the length marks zlib."""
+    # Same protocol the preset dictionary was built from, so compression ratios hold
+    serialized = pickle.dumps(data, protocol=framecodec.PICKLE_PROTOCOL)
+    if compress:
+        serialized, packed = framecodec.maybe_compress(serialized, stream)
+        if packed:
+            return struct.pack('>I', len(serialized) | framecodec.COMPRESS_FLAG) + serialized
+    return struct.pack('>I', len(serialized)) + serialized
+
+
+def recv_exact(sock, n):
+    data = b""
+    while len(data) < n:
+        try:
+            packet = sock.recv(n - len(data))
+        except socket.timeout:
+            continue
+        if not packet: return None
+        data += packet
+    return data
+
+def recv_frame_bytes(sock):
+    """Reads one whole frame (header included) without unpickling it"""
+    header = recv_exact(sock, 4)
+    if not header: return None
+    body = recv_exact(sock, struct.unpack('>I', header)[0] & framecodec.LENGTH_MASK)
+    if body is None: return None
+    return header + body
+
+
+# --- SPECTATOR HUB ---
+# Spectators all get the same already-encoded bytes. ONE selector thread
+# serves every one of them: it writes to non-blocking sockets as they become
+# writable, and reads only to notice hang-ups and the one thing a spectator
+# may say: "SHARD:n\n", which match (engine shard) it wants to watch. Until it
+# says so, or SHARD_WAIT passes and it gets shard 0, it is sent nothing.
+# Each spectator holds at most the frame being written plus the newest one
+# waiting; anything older is dropped. Eviction follows the player rules: a
+# frame stuck for WRITE_TIMEOUT, or EVICT_AFTER_DROPS drops in a row.
+SHARD_WAIT = 0.2            # Seconds a silent spectator waits before it watches shard 0
+SHARD_REQUEST = b"SHARD:"
+MAX_REQUEST = 64            # Bytes of unparsed spectator input kept
+
+def shard_request(shard):
+    """What a spectator (or relay) sends right after connecting to pick a match"""
+    return SHARD_REQUEST + f"{shard}\n".encode()
+
+
+class Spectator:
+    __slots__ = ("conn", "pid", "alive", "close_reason", "sending", "send_started", "waiting",
+                 "frames_sent", "frames_dropped", "drop_streak", "shard", "joined_at", "inbox")
+
+    def __init__(self, conn, pid):
+        conn.setblocking(False)
+        self.conn = conn
+        self.pid = pid
+        self.alive = True
+        self.close_reason = None
+        self.sending = None       # memoryview of what's left of the frame on the wire
+        self.send_started = 0.0
+        self.waiting = None       # Newest frame not started yet
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.drop_streak = 0
+        self.shard = None         # Not chosen yet
+        self.joined_at = time.time()
+        self.inbox = b""
+
+
+class SpectatorHub:
+    def __init__(self, name="spectators", shards=1):
+        self.shards = shards
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()
+        self.spectators = {}      # pid -> Spectator
+        self.dirty = set()        # Got a frame since the writer thread last looked
+        self.next_id = 0
+        # Other threads poke the selector through this pair instead of touching it
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ, None)
+        threading.Thread(target=self._loop, name=name, daemon=True).start()
+
+    def __len__(self):
+        return len(self.spectators)
+
+    def values(self):
+        with self.lock:
+            return list(self.spectators.values())
+
+    def watched(self):
+        """Shards someone is (or is about to be) watching"""
+        with self.lock:
+            return {0 if s.shard is None else s.shard for s in self.spectators.values()}
+
+    def add(self, conn, first_frame=None):
+        with self.lock:
+            self.next_id += 1
+            spectator = Spectator(conn, self.next_id)
+            self.spectators[spectator.pid] = spectator
+            spectator.waiting = first_frame
+            self.dirty.add(spectator)
+        self._wake()
+        return spectator
+
+    def broadcast(self, frame, shard=None):
+        """Never blocks: hands frame (encoded bytes) to every spectator of shard
+        (None: to every spectator, for a relay's single upstream)"""
+        now = time.time()
+        with self.lock:
+            for spectator in self.spectators.values():
+                if shard is not None:
+                    if spectator.shard is None:
+                        if now - spectator.joined_at < SHARD_WAIT: continue
+                        spectator.shard = 0
+                    if spectator.shard != shard: continue
+                if spectator.waiting is not None:
+                    spectator.frames_dropped += 1
+                    spectator.drop_streak += 1
+                    metrics.inc("net_frames_dropped", spectator=spectator.pid)
+                spectator.waiting = frame
+                self.dirty.add(spectator)
+        self._wake()
+
+    def _wake(self):
+        try: self.wake_w.send(b"\0")
+        except (BlockingIOError, OSError): pass  # Already awake (pipe full) or shutting down
+
+    def _close(self, spectator, reason):
+        if not spectator.alive: return
+        spectator.alive = False
+        spectator.close_reason = reason
+        with self.lock:
+            self.spectators.pop(spectator.pid, None)
+            self.dirty.discard(spectator)
+        try: self.selector.unregister(spectator.conn)
+        except (KeyError, ValueError): pass
+        if not reason.startswith("spectator left"):
+            metrics.inc("net_clients_evicted")
+        metrics.forget("spectator", spectator.pid)
+        try: spectator.conn.close()
+        except OSError: pass
+        print(f"[NET] Spectator {spectator.pid} closed: {reason} (sent={spectator.frames_sent}, dropped={spectator.frames_dropped})")
+
+    def _read(self, spectator, data):
+        """Picks up "SHARD:n" lines; anything else is ignored"""
+        spectator.inbox += data
+        while b"\n" in spectator.inbox:
+            line, _, spectator.inbox = spectator.inbox.partition(b"\n")
+            if not line.startswith(SHARD_REQUEST): continue
+            try: shard = int(line[len(SHARD_REQUEST):])
+            except ValueError: continue
+            if 0 <= shard < self.shards:
+                spectator.shard = shard
+                print(f"[NET] Spectator {spectator.pid} watching shard {shard}")
+        if len(spectator.inbox) > MAX_REQUEST: spectator.inbox = b""
+
+    def _write(self, spectator):
+        """Sends until the socket would block or there's nothing left"""
+        while True:
+            if spectator.sending is None:
+                with self.lock:
+                    frame, spectator.waiting = spectator.waiting, None
+                if frame is None: return
+                spectator.sending = memoryview(frame)
+                spectator.send_started = time.time()
+            try:
+                sent = spectator.conn.send(spectator.sending)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self._close(spectator, f"send failed ({e})")
+                return
+            spectator.sending = spectator.sending[sent:]
+            metrics.inc("net_bytes_sent", sent)
+            metrics.inc("net_client_bytes_sent", sent, spectator=spectator.pid)
+            if len(spectator.sending) == 0:
+                spectator.sending = None
+                spectator.frames_sent += 1
+                spectator.drop_streak = 0
+                metrics.inc("net_frames_sent")
+
+    def _watch(self, spectator):
+        """(Re)registers: always readable (hang-ups), writable only with data pending"""
+        events = selectors.EVENT_READ
+        if spectator.sending is not None or spectator.waiting is not None:
+            events |= selectors.EVENT_WRITE
+        try: self.selector.modify(spectator.conn, events, spectator)
+        except KeyError: self.selector.register(spectator.conn, events, spectator)
+
+    def _loop(self):
+        while True:
+            try:
+                events = self.selector.select(timeout=0.5)
+            except OSError:
+                continue
+            for key, mask in events:
+                spectator = key.data
+                if spectator is None:
+                    try:
+                        while self.wake_r.recv(4096): pass
+                    except (BlockingIOError, OSError): pass
+                    continue
+                if mask & selectors.EVENT_READ:
+                    try:
+                        data = spectator.conn.recv(4096)
+                        if not data:
+                            self._close(spectator, "spectator left")
+                            continue
+                        self._read(spectator, data)
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    except OSError:
+                        self._close(spectator, "spectator left (connection reset)")
+                        continue
+                if mask & selectors.EVENT_WRITE:
+                    self._write(spectator)
+                if spectator.alive: self._watch(spectator)
+
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+            for spectator in dirty:
+                if not spectator.alive: continue
+                self._write(spectator)
+                if spectator.alive: self._watch(spectator)
+
+            now = time.time()
+            for spectator in self.values():
+                if spectator.sending is not None and now - spectator.send_started > WRITE_TIMEOUT:
+                    self._close(spectator, f"write timed out after {WRITE_TIMEOUT}s")
+                elif spectator.drop_streak >= EVICT_AFTER_DROPS:
+                    self._close(spectator, f"fell {spectator.drop_streak} frames behind")
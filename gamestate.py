@@ -0,0 +1,144 @@
+import pickle
+from collections import deque
+
+import board
+
+# --- SHARED GAME STATE ---
+# One definition of a match for the engine (server.py), the threaded servers
+# (backupserver.py, mainbackupserver.py) and the client. The live objects use
+# __slots__ (no per-instance dict, faster attribute access in the tick loop);
+# snapshot() turns them into the plain dict that goes over the wire, which
+# is what interest.py, udp_transport.py, relay.py and framecodec.py handle.
+WAITING = "WAITING"
+COUNTDOWN = "COUNTDOWN"
+RUNNING = "RUNNING"
+GAME_OVER = "GAME_OVER"
+PICKLE_PROTOCOL = 4
+
+
+class Snake:
+    __slots__ = ("body",)
+
+    def __init__(self, body=()):
+        self.body = deque(body)   # (x, y) cells, tail first, head last
+
+    def __len__(self):
+        return len(self.body)
+
+    def __iter__(self):
+        return iter(self.body)
+
+
+class Player:
+    __slots__ = ("pid", "snake", "score", "direction", "label", "ack")
+
+    def __init__(self, pid, snake=None, score=0, label=None):
+        self.pid = pid
+        self.snake = snake if snake is not None else Snake()
+        self.score = score
+        self.direction = (0, 0)   # Last input; (0, 0) = standing still
+        self.label = label        # Threaded servers: name of the thread serving this player
+        self.ack = None           # (input seq, tick, time) of the newest stamped input applied
+
+
+class Match:
+    __slots__ = ("players", "food", "board_w", "board_h", "status", "game_mode", "countdown",
+                 "timer_start", "winner", "game_over_time", "debug_info", "viewport", "you", "tick")
+
+    def __init__(self, board_w=board.DEFAULT_BOARD_W, board_h=board.DEFAULT_BOARD_H):
+        self.players = {}         # pid -> Player, in join order
+        self.food = (5, 5)
+        self.board_w = board_w
+        self.board_h = board_h
+        self.status = WAITING
+        self.game_mode = "PVP"
+        self.countdown = 3
+        self.timer_start = None
+        self.winner = None
+        self.game_over_time = None
+        self.debug_info = {}      # Client side only: last dashboard telemetry (telemetry.py)
+        self.viewport = None      # Client side only: what interest.filter_state sent us
+        self.you = None
+        self.tick = 0             # Engine tick counter (what input acks refer to)
+
+    # --- PLAYERS ---
+    def spawn(self, pid, occupied=None):
+        """Adds (or respawns) pid on a free spot, standing still. Returns the Player."""
+        player = self.players.get(pid)
+        if player is None:
+            player = self.players[pid] = Player(pid)
+        player.snake = Snake(board.random_spawn(self.board_w, self.board_h, occupied))
+        player.direction = (0, 0)
+        return player
+
+    def remove(self, pid):
+        return self.players.pop(pid, None)
+
+    def reset_scores(self):
+        for player in self.players.values():
+            player.score = 0
+
+    def occupancy(self):
+        """Cell -> owner pid for every segment on the board"""
+        occupied = {}
+        for pid, player in self.players.items():
+            for segment in player.snake.body:
+                occupied[segment] = pid
+        return occupied
+
+    def new_food(self, occupied=None):
+        self.food = board.random_food(self.board_w, self.board_h, occupied)
+
+    # --- WIRE FORMAT ---
+    def snapshot(self):
+        """Plain, immutable-ish copy for the Manager, the network and the client"""
+        snapshot = {
+            "players": {pid: tuple(p.snake.body) for pid, p in self.players.items()},
+            "scores": {pid: p.score for pid, p in self.players.items()},
+            "food": self.food,
+            "board_w": self.board_w,
+            "board_h": self.board_h,
+            "status": self.status,
+            "game_mode": self.game_mode,
+            "countdown": self.countdown,
+            "timer_start": self.timer_start,
+            "winner": self.winner,
+            "game_over_time": self.game_over_time,
+            "tick": self.tick,
+        }
+        acks = {pid: p.ack for pid, p in self.players.items() if p.ack is not None}
+        if acks: snapshot["acks"] = acks
+        labels = {pid: p.label for pid, p in self.players.items() if p.label is not None}
+        if labels: snapshot["threads"] = labels
+        return snapshot
+
+    def encode(self):
+        """snapshot() pickled once, ready to send to any number of clients"""
+        return pickle.dumps(self.snapshot(), protocol=PICKLE_PROTOCOL)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Typed view of a received frame. Scores can outnumber snakes (viewport filtering)."""
+        match = cls(snapshot.get("board_w", board.DEFAULT_BOARD_W), snapshot.get("board_h", board.DEFAULT_BOARD_H))
+        bodies = snapshot.get("players", {})
+        for pid, score in snapshot.get("scores", {}).items():
+            match.players[pid] = Player(pid, score=score)
+        for pid, body in bodies.items():
+            player = match.players.get(pid)
+            if player is None: player = match.players[pid] = Player(pid)
+            player.snake = Snake(body)
+        for pid, label in snapshot.get("threads", {}).items():
+            if pid in match.players: match.players[pid].label = label
+        for pid, ack in snapshot.get("acks", {}).items():
+            if pid in match.players: match.players[pid].ack = ack
+        match.food = snapshot.get("food")
+        match.status = snapshot.get("status", WAITING)
+        match.game_mode = snapshot.get("game_mode", "PVP")
+        match.countdown = snapshot.get("countdown", 3)
+        match.timer_start = snapshot.get("timer_start")
+        match.winner = snapshot.get("winner")
+        match.game_over_time = snapshot.get("game_over_time")
+        match.viewport = snapshot.get("viewport")
+        match.you = snapshot.get("you")
+        match.tick = snapshot.get("tick", 0)
+        return match
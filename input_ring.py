@@ -0,0 +1,121 @@
+import struct
+import time
+import multiprocessing
+
+import board
+import metrics
+
+# --- INPUT RING ---
+# Player inputs travel from the network (and AI) process to the engine as
+# fixed-size records in a shared-memory ring buffer. A put is a struct pack
+# and a slice copy under a lock; the engine takes everything written since
+# its last tick in ONE drain() call and decodes it outside the lock.
+# Nothing is pickled, and there's no feeder thread per message like
+# multiprocessing.Queue has.
+#
+# Record: pid (int32), kind (uint8), dx, dy (int8), pad, arg0, arg1 (uint16)
+# Moves put the client's input sequence number (latency.py) in arg0.
+RECORD = struct.Struct("<iBbbxHH")
+RECORD_SIZE = RECORD.size
+RING_RECORDS = 8192           # ~80 ticks of 100 inputs; a full ring makes producers wait
+FULL_WAIT = 0.001
+
+KIND_MOVE = 0
+KIND_JOIN = 1
+KIND_LEAVE = 2
+KIND_MODE = 3
+KIND_BOARD = 4
+GAME_MODES = ("PVP", "PVAI")
+
+
+MOVES = {(dx, dy): (KIND_MOVE, dx, dy, 0, 0) for dx in (-1, 0, 1) for dy in (-1, 0, 1)}
+
+def encode(message, seq=0):
+    """message -> (kind, dx, dy, arg0, arg1), or None if the engine wouldn't understand it"""
+    if type(message) is tuple:
+        move = MOVES.get(message)
+        if move is None or not seq: return move
+        if not 0 < seq <= 0xFFFF: return None
+        return (KIND_MOVE, move[1], move[2], seq, 0)
+    if message == "NEW_PLAYER":
+        return (KIND_JOIN, 0, 0, 0, 0)
+    if message == "DISCONNECT":
+        return (KIND_LEAVE, 0, 0, 0, 0)
+    if isinstance(message, str) and message.startswith("MODE:"):
+        mode = message.split(":", 1)[1]
+        if mode not in GAME_MODES: return None
+        return (KIND_MODE, 0, 0, GAME_MODES.index(mode), 0)
+    if isinstance(message, str) and message.startswith("BOARD:"):
+        try: board_w, board_h = board.parse_board_size(message.split(":", 1)[1])
+        except ValueError: return None
+        return (KIND_BOARD, 0, 0, board_w, board_h)
+    return None
+
+def decode(record):
+    """Back to the (pid, message) shapes the engine has always handled, plus the move's seq (0 = none)"""
+    pid, kind, dx, dy, arg0, arg1 = record
+    if kind == KIND_MOVE: return pid, (dx, dy), arg0
+    if kind == KIND_JOIN: return pid, "NEW_PLAYER", 0
+    if kind == KIND_LEAVE: return pid, "DISCONNECT", 0
+    if kind == KIND_MODE: return pid, f"MODE:{GAME_MODES[arg0]}", 0
+    return pid, f"BOARD:{arg0}x{arg1}", 0
+
+
+class InputRing:
+    """Many producers (threads or processes), one consumer (the engine).
+    Pass it to multiprocessing.Process like a Queue. ctx is the context of the
+    start method the engine runs under (a fork-made lock can't go to spawn or
+    forkserver children); forked producers inherit it either way."""
+
+    def __init__(self, capacity=RING_RECORDS, ctx=multiprocessing):
+        self.capacity = capacity
+        self.buf = ctx.RawArray("B", capacity * RECORD_SIZE)
+        self.counters = ctx.RawArray("Q", 2)   # [records written, records read]
+        self.lock = ctx.Lock()
+
+    def put(self, pid, message, seq=0):
+        """Returns False (and drops the input) if the engine couldn't decode it"""
+        fields = encode(message, seq)
+        if fields is None:
+            metrics.inc("input_rejected")
+            return False
+        counters, lock = self.counters, self.lock
+        while True:
+            lock.acquire()
+            try:
+                written = counters[0]
+                if written - counters[1] < self.capacity:
+                    RECORD.pack_into(self.buf, (written % self.capacity) * RECORD_SIZE, pid, *fields)
+                    counters[0] = written + 1
+                    return True
+            finally:
+                lock.release()
+            # Engine is behind by a whole ring: wait rather than lose a join/leave
+            metrics.inc("input_ring_full_waits")
+            time.sleep(FULL_WAIT)
+
+    def recover(self, wait=0.5):
+        """After the consumer died: frees the lock if it was left held (no live
+        producer holds it for more than microseconds). Returns True if it was."""
+        if self.lock.acquire(timeout=wait):
+            self.lock.release()
+            return False
+        self.lock.release()
+        return True
+
+    def drain(self):
+        """Everything written since the last drain, as [(pid, message, seq)] in arrival order"""
+        counters = self.counters
+        with self.lock:
+            written, read = counters[0], counters[1]
+            count = written - read
+            if count == 0: return []
+            start = (read % self.capacity) * RECORD_SIZE
+            end = start + count * RECORD_SIZE
+            size = len(self.buf)
+            if end <= size:
+                raw = bytes(memoryview(self.buf)[start:end])
+            else:
+                raw = bytes(memoryview(self.buf)[start:]) + bytes(memoryview(self.buf)[:end - size])
+            counters[1] = written
+        return [decode(record) for record in RECORD.iter_unpack(raw)]
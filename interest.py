@@ -0,0 +1,95 @@
+import board
+
+# --- INTEREST MANAGEMENT ---
+# Each client only receives what is inside its viewport (a window of cells
+# centred on its own snake). The board is split into square buckets so a
+# viewport query only touches the buckets it overlaps, never the whole board.
+BUCKET_SIZE = 16
+DEFAULT_VIEW_W = 50
+DEFAULT_VIEW_H = 50
+MAX_VIEW_SIZE = 200
+MAX_SCORES_SENT = 8
+
+
+def parse_view_size(text):
+    """Parses "WxH" from a VIEW:WxH request into a clamped (w, h) tuple"""
+    w, h = text.lower().split("x")
+    w = max(board.MIN_BOARD_SIZE, min(MAX_VIEW_SIZE, int(w)))
+    h = max(board.MIN_BOARD_SIZE, min(MAX_VIEW_SIZE, int(h)))
+    return w, h
+
+
+def build_bucket_index(players):
+    """bucket (bx, by) -> list of (pid, segment_index, cell). Built once per frame."""
+    index = {}
+    for pid, snake in players.items():
+        for i, cell in enumerate(snake):
+            key = (cell[0] // BUCKET_SIZE, cell[1] // BUCKET_SIZE)
+            bucket = index.get(key)
+            if bucket is None:
+                index[key] = bucket = []
+            bucket.append((pid, i, cell))
+    return index
+
+
+def compute_viewport(state, pid, view_w, view_h):
+    """Window (x0, y0, w, h) centred on the player's head, clamped to the board"""
+    board_w = state.get("board_w", board.DEFAULT_BOARD_W)
+    board_h = state.get("board_h", board.DEFAULT_BOARD_H)
+    view_w, view_h = min(view_w, board_w), min(view_h, board_h)
+
+    snake = state.get("players", {}).get(pid)
+    if snake:
+        cx, cy = snake[-1]
+    else:
+        cx, cy = board_w // 2, board_h // 2
+
+    x0 = max(0, min(board_w - view_w, cx - view_w // 2))
+    y0 = max(0, min(board_h - view_h, cy - view_h // 2))
+    return (x0, y0, view_w, view_h)
+
+
+def query_viewport(index, viewport):
+    """Returns {pid: [cells in order]} for every segment inside the viewport"""
+    x0, y0, w, h = viewport
+    x1, y1 = x0 + w, y0 + h
+    found = {}
+    for bx in range(x0 // BUCKET_SIZE, (x1 - 1) // BUCKET_SIZE + 1):
+        for by in range(y0 // BUCKET_SIZE, (y1 - 1) // BUCKET_SIZE + 1):
+            for pid, i, cell in index.get((bx, by), ()):
+                if x0 <= cell[0] < x1 and y0 <= cell[1] < y1:
+                    found.setdefault(pid, []).append((i, cell))
+
+    # Buckets are visited out of order, so restore head-last ordering per snake
+    visible = {}
+    for pid, parts in found.items():
+        parts.sort()
+        visible[pid] = [cell for _, cell in parts]
+    return visible
+
+
+def filter_state(state, index, pid, view_w=DEFAULT_VIEW_W, view_h=DEFAULT_VIEW_H):
+    """Builds the per-client copy of the state: only entities in the viewport"""
+    viewport = compute_viewport(state, pid, view_w, view_h)
+    visible = query_viewport(index, viewport)
+
+    # Scores: yourself plus whoever is on screen (bounded, not every player)
+    all_scores = state.get("scores", {})
+    shown = [p for p in visible if p != pid][:MAX_SCORES_SENT - 1]
+    if pid in all_scores: shown.insert(0, pid)
+    scores = {p: all_scores[p] for p in shown if p in all_scores}
+
+    view_state = dict(state)
+    view_state["players"] = visible
+    view_state["scores"] = scores
+    view_state["viewport"] = viewport
+    view_state["you"] = pid
+    # Input acks: only your own (see latency.py)
+    acks = view_state.pop("acks", None)
+    if acks and pid in acks: view_state["ack"] = acks[pid]
+
+    x0, y0, w, h = viewport
+    food = state.get("food")
+    if food and not (x0 <= food[0] < x0 + w and y0 <= food[1] < y0 + h):
+        view_state["food"] = None
+    return view_state
@@ -0,0 +1,136 @@
+import time
+
+import metrics
+
+# --- END-TO-END LATENCY ---
+# Keypress -> snake turning on screen, measured by the client on its own clock.
+#  * Inputs carry a sequence number and the client's send time:
+#        ("MOVE", seq, (dx, dy), sent_at)
+#  * The engine stamps the tick that applied each player's newest input; the
+#    player's frames carry it back as "ack": (seq, tick, applied_at).
+#  * About once a second the client sends ("PING", seq, sent_at, report). The
+#    network process answers in that player's next frame with
+#    "pong": (seq, sent_at, received_at, replied_at), which gives RTT and the
+#    clock offset the NTP way (the time the ping waited for a frame is not
+#    counted). report is the client's own numbers, exported per player.
+# Plain (dx, dy) tuples (the AI, older clients) still work, just unmeasured.
+PING_INTERVAL = 1.0
+SEQ_MOD = 1 << 16          # Sequence numbers ride the input ring as uint16
+RECENT_INPUTS = 64         # Unacknowledged inputs remembered per player
+SMOOTHING = 0.2            # Weight of a new sample in the dashboard averages
+REPORT_FIELDS = ("rtt_ms", "offset_ms", "input_ms")
+
+
+def next_seq(seq):
+    """1..65535 then back to 1; 0 means "no sequence number" """
+    return seq % (SEQ_MOD - 1) + 1
+
+def seq_reached(acked, seq):
+    """True if acked is seq or newer, allowing for wrap-around"""
+    return (acked - seq) % SEQ_MOD < SEQ_MOD // 2
+
+def is_move(message):
+    return type(message) is tuple and len(message) == 4 and message[0] == "MOVE"
+
+def is_ping(message):
+    return type(message) is tuple and len(message) == 4 and message[0] == "PING"
+
+def _smooth(old, sample):
+    return sample if old is None else old + SMOOTHING * (sample - old)
+
+
+# --- CLIENT SIDE ---
+class ClientLatency:
+    """Builds the stamped messages and turns acks/pongs into milliseconds"""
+
+    def __init__(self):
+        self.input_seq = 0
+        self.last_direction = None
+        self.pressed = {}         # input seq -> client time the direction changed
+        self.ping_seq = 0
+        self.ping_open = False
+        self.next_ping = 0.0
+        self.tick = None          # Engine tick of the newest ack
+        self.rtt_ms = None
+        self.offset_ms = None     # Server clock minus client clock
+        self.input_ms = None      # Keypress -> first frame showing it
+        self.uplink_ms = None     # Keypress -> engine tick that applied it
+
+    def move(self, direction, now=None):
+        """The message to send for direction; only direction changes are timed"""
+        now = time.time() if now is None else now
+        self.input_seq = next_seq(self.input_seq)
+        if direction != self.last_direction:
+            self.last_direction = direction
+            self.pressed[self.input_seq] = now
+            if len(self.pressed) > RECENT_INPUTS:
+                del self.pressed[next(iter(self.pressed))]
+        return ("MOVE", self.input_seq, direction, now)
+
+    def ping(self, now=None):
+        """A PING message when one is due, else None"""
+        now = time.time() if now is None else now
+        if now < self.next_ping: return None
+        self.next_ping = now + PING_INTERVAL
+        self.ping_seq = next_seq(self.ping_seq)
+        self.ping_open = True
+        return ("PING", self.ping_seq, now, self.report())
+
+    def on_frame(self, frame, now=None):
+        """Call with every received frame (the raw dict), before drawing it"""
+        now = time.time() if now is None else now
+        pong = frame.get("pong")
+        if pong and self.ping_open and pong[0] == self.ping_seq:
+            self.ping_open = False
+            _, sent_at, received_at, replied_at = pong
+            self.rtt_ms = _smooth(self.rtt_ms, ((now - sent_at) - (replied_at - received_at)) * 1000)
+            self.offset_ms = _smooth(self.offset_ms, ((received_at - sent_at) + (replied_at - now)) / 2 * 1000)
+
+        ack = frame.get("ack")
+        if not ack: return
+        seq, self.tick, applied_at = ack
+        for pressed_seq in [s for s in self.pressed if seq_reached(seq, s)]:
+            pressed_at = self.pressed.pop(pressed_seq)
+            self.input_ms = _smooth(self.input_ms, (now - pressed_at) * 1000)
+            if self.offset_ms is not None:
+                self.uplink_ms = _smooth(self.uplink_ms, (applied_at - self.offset_ms / 1000 - pressed_at) * 1000)
+
+    def report(self):
+        return {name: round(getattr(self, name), 1) for name in REPORT_FIELDS if getattr(self, name) is not None}
+
+
+# --- SERVER SIDE (network process) ---
+class PlayerLatency:
+    """One per player: answers pings and times input arrival -> engine ack"""
+    __slots__ = ("received", "pong", "last_ack")
+
+    def __init__(self):
+        self.received = {}        # input seq -> server time it arrived
+        self.pong = None
+        self.last_ack = 0
+
+    def on_input(self, seq, now):
+        self.received[seq] = now
+        if len(self.received) > RECENT_INPUTS:
+            del self.received[next(iter(self.received))]
+
+    def on_ping(self, pid, message, now):
+        _, seq, sent_at, report = message
+        self.pong = (seq, sent_at, now)
+        if not isinstance(report, dict): return
+        for name in REPORT_FIELDS:
+            try: metrics.gauge(f"latency_{name}", float(report[name]), client=pid)
+            except (KeyError, TypeError, ValueError): pass
+
+    def on_frame(self, pid, view, now):
+        """Adds a waiting pong to this player's frame and times the engine's ack"""
+        if self.pong:
+            view["pong"] = self.pong + (now,)
+            self.pong = None
+        ack = view.get("ack")
+        if ack and ack[0] != self.last_ack:
+            self.last_ack = ack[0]
+            received = self.received.pop(ack[0], None)
+            if received is not None:
+                # Ring wait + tick phase + Manager round trip, on the server alone
+                metrics.observe("latency_server_input_ms", (now - received) * 1000, client=pid)
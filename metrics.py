@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+import http.server
+import urllib.parse
+
+# --- METRICS ---
+# Every process keeps its own registry (module globals are per-process).
+# The engine and AI publish snapshots into the shared Manager dict about once
+# a second; the network process merges them with its own and serves the lot
+# as plain text on a local port (and optionally dumps it to a file).
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 5556
+PUBLISH_INTERVAL = 1.0
+SHARED_KEY_PREFIX = "metrics:"
+
+# Histogram bucket upper bounds (milliseconds for timings, plain values otherwise)
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "total", "max")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = 0
+        for bound in self.buckets:
+            if value <= bound: break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+
+    def snapshot(self):
+        return {"buckets": self.buckets, "counts": list(self.counts), "count": self.count, "sum": self.total, "max": self.max}
+
+
+class Registry:
+    """Counters, gauges and histograms keyed by (name, labels)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                self.histograms[key] = hist = Histogram()
+            hist.observe(value)
+
+    def forget(self, label, value):
+        """Drops every series carrying label=value (e.g. a disconnected client)"""
+        with self.lock:
+            for table in (self.counters, self.gauges, self.histograms):
+                for key in [k for k in table if (label, value) in k[1]]:
+                    del table[key]
+
+    def snapshot(self):
+        """Plain dicts/tuples, safe to pickle into the Manager"""
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {k: h.snapshot() for k, h in self.histograms.items()},
+            }
+
+
+class Timer:
+    """with timer("engine_tick_ms"): ... -> observes elapsed milliseconds"""
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        registry.observe(self.name, (time.perf_counter() - self.start) * 1000, **self.labels)
+        return False
+
+
+registry = Registry()
+inc = registry.inc
+gauge = registry.gauge
+observe = registry.observe
+forget = registry.forget
+snapshot = registry.snapshot
+
+def timer(name, **labels):
+    return Timer(name, labels)
+
+# --- PROCESS CPU ---
+class CpuMeter:
+    """CPU time this process used since the last sample, as a % of one core"""
+
+    def __init__(self):
+        self.last_wall = time.perf_counter()
+        self.last_cpu = time.process_time()
+
+    def sample(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        if wall > self.last_wall:
+            gauge("process_cpu_percent", round(100 * (cpu - self.last_cpu) / (wall - self.last_wall), 1))
+        gauge("process_cpu_seconds", round(cpu, 3))
+        self.last_wall, self.last_cpu = wall, cpu
+
+
+# --- PUBLISHING (engine / AI processes) ---
+class Publisher:
+    """Call tick() from a hot loop; it only touches the Manager once per interval"""
+
+    def __init__(self, shared_return_dict, process_name, interval=PUBLISH_INTERVAL):
+        self.shared = shared_return_dict
+        self.key = SHARED_KEY_PREFIX + process_name
+        self.interval = interval
+        self.next_time = 0
+        self.cpu = CpuMeter()
+
+    def tick(self):
+        now = time.time()
+        if now < self.next_time: return
+        self.next_time = now + self.interval
+        self.cpu.sample()
+        if self.shared is None: return
+        try: self.shared[self.key] = snapshot()
+        except Exception: pass
+
+def start_publisher_thread(shared_return_dict, process_name, interval=PUBLISH_INTERVAL):
+    """For processes without a hot loop to tick from (network workers).
+    shared_return_dict=None only samples CPU (the process serving /metrics)."""
+    publisher = Publisher(shared_return_dict, process_name, interval)
+    def publish_loop():
+        while True:
+            publisher.tick()
+            time.sleep(interval)
+    threading.Thread(target=publish_loop, daemon=True).start()
+    return publisher
+
+
+# --- EXPORT (network process) ---
+def _format_labels(process, labels, extra=()):
+    parts = [f'process="{process}"'] + [f'{k}="{v}"' for k, v in labels] + [f'{k}="{v}"' for k, v in extra]
+    return "{" + ",".join(parts) + "}"
+
+def render_text(snapshots):
+    """Prometheus-style text for {process_name: snapshot}"""
+    lines = []
+    for process, snap in sorted(snapshots.items()):
+        for (name, labels), value in sorted(snap["counters"].items(), key=str):
+            lines.append(f"{name}_total{_format_labels(process, labels)} {value}")
+        for (name, labels), value in sorted(snap["gauges"].items(), key=str):
+            lines.append(f"{name}{_format_labels(process, labels)} {value}")
+        for (name, labels), hist in sorted(snap["histograms"].items(), key=str):
+            cumulative = 0
+            for bound, count in zip(list(hist["buckets"]) + ["+Inf"], hist["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(process, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_count{_format_labels(process, labels)} {hist['count']}")
+            lines.append(f"{name}_sum{_format_labels(process, labels)} {hist['sum']:.3f}")
+            lines.append(f"{name}_max{_format_labels(process, labels)} {hist['max']:.3f}")
+    return "\n".join(lines) + "\n"
+
+def collect(shared_return_dict, process_name="network"):
+    """Own registry + whatever the other processes last published"""
+    snapshots = {process_name: snapshot()}
+    try:
+        for key in shared_return_dict.keys():
+            if isinstance(key, str) and key.startswith(SHARED_KEY_PREFIX) and key != SHARED_KEY_PREFIX + process_name:
+                snapshots[key[len(SHARED_KEY_PREFIX):]] = shared_return_dict[key]
+    except Exception: pass
+    return snapshots
+
+def start_http_server(shared_return_dict, host=METRICS_HOST, port=METRICS_PORT, routes=None):
+    """routes: extra {path: fn(query_dict) -> text} served next to /metrics"""
+    routes = routes or {}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path in routes:
+                query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+                body = routes[url.path](query).encode()
+            elif url.path in ("/", "/metrics"):
+                body = render_text(collect(shared_return_dict)).encode()
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args): pass  # Keep the console for game logs
+
+    httpd = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    print(f"[METRICS] Serving on http://{host}:{port}/metrics")
+    return httpd
+
+def start_file_dump(shared_return_dict, path, interval=10.0):
+    def dump_loop():
+        while True:
+            time.sleep(interval)
+            try:
+                with open(path + ".tmp", "w") as f:
+                    f.write(f"# {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+                    f.write(render_text(collect(shared_return_dict)))
+                # Rename is atomic, so readers never see half a file
+                os.replace(path + ".tmp", path)
+            except Exception as e:
+                print(f"[METRICS] Dump Error: {e}")
+    threading.Thread(target=dump_loop, daemon=True).start()
+    print(f"[METRICS] Dumping to {path} every {interval}s")
@@ -0,0 +1,129 @@
+import os
+import sys
+import signal
+import threading
+import time
+
+# --- SAMPLING PROFILER ---
+# Off by default: nothing runs until someone turns it on. When on, a daemon
+# thread wakes every SAMPLE_INTERVAL, grabs every thread's stack with
+# sys._current_frames() and counts it. Stopping writes a collapsed-stack
+# file ("a;b;c 42" per line) that flamegraph.pl / speedscope read directly.
+SAMPLE_INTERVAL = 0.005
+PROFILE_DIR = "profiles"
+CONTROL_KEY_PREFIX = "profile:"
+RESULT_KEY_PREFIX = "profile_result:"
+CONTROL_POLL_INTERVAL = 1.0
+
+
+class SamplingProfiler:
+    def __init__(self, process_name, interval=SAMPLE_INTERVAL, out_dir=PROFILE_DIR):
+        self.process_name = process_name
+        self.interval = interval
+        self.out_dir = out_dir
+        self.thread = None
+        self.running = False
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = None
+
+    def start(self):
+        if self.running: return
+        self.running = True
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = time.time()
+        self.thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+        self.thread.start()
+        print(f"[PROFILE] {self.process_name} ({os.getpid()}) sampling every {self.interval * 1000:.1f}ms")
+
+    def stop(self):
+        """Stops sampling and writes the collapsed stacks. Returns the file path."""
+        if not self.running: return None
+        self.running = False
+        self.thread.join()
+        return self._write()
+
+    def toggle(self):
+        if self.running: return self.stop()
+        self.start()
+        return None
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        names = {}
+        while self.running:
+            for ident, frame in sys._current_frames().items():
+                if ident == me: continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+    def _write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.out_dir, f"{self.process_name}-{os.getpid()}-{stamp}.folded")
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {count}\n")
+        elapsed = time.time() - self.started_at
+        print(f"[PROFILE] {self.process_name}: {self.samples} samples over {elapsed:.1f}s -> {path}")
+        return path
+
+
+def install_signal_toggle(profiler):
+    """SIGUSR1 starts/stops the profiler (Unix only, must run in the main thread)"""
+    if not hasattr(signal, "SIGUSR1"): return
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle())
+
+
+class ControlPoller:
+    """Applies start/stop requests another process leaves in profile:<name>.
+    tick() is a clock compare except once per CONTROL_POLL_INTERVAL."""
+
+    def __init__(self, shared_return_dict, profiler):
+        self.shared = shared_return_dict
+        self.profiler = profiler
+        self.key = CONTROL_KEY_PREFIX + profiler.process_name
+        self.result_key = RESULT_KEY_PREFIX + profiler.process_name
+        self.next_time = 0
+
+    def tick(self):
+        now = time.time()
+        if now < self.next_time: return
+        self.next_time = now + CONTROL_POLL_INTERVAL
+        try:
+            # A request is used up once read, so no request leaves a SIGUSR1
+            # toggle alone, and "stop" also stops a profiler SIGUSR1 started
+            wanted = self.shared.pop(self.key, None)
+            if wanted is None or wanted == self.profiler.running: return
+            if wanted:
+                self.profiler.start()
+            else:
+                self.shared[self.result_key] = self.profiler.stop()
+        except Exception as e:
+            print(f"[PROFILE] Control Error: {e}")
+
+
+def handle_control(shared_return_dict, local_profiler, process, action):
+    """Used by the metrics HTTP endpoint: /profile?process=engine&action=start"""
+    if action not in ("start", "stop"):
+        return "action must be start or stop\n"
+    if process == local_profiler.process_name:
+        if action == "start":
+            local_profiler.start()
+            return f"{process}: started\n"
+        return f"{process}: wrote {local_profiler.stop()}\n"
+    shared_return_dict[CONTROL_KEY_PREFIX + process] = (action == "start")
+    if action == "start":
+        return f"{process}: start requested\n"
+    return f"{process}: stop requested (file path appears in {RESULT_KEY_PREFIX}{process} within {CONTROL_POLL_INTERVAL:.0f}s)\n"
@@ -0,0 +1,88 @@
+import socket
+import threading
+import time
+import argparse
+
+from connection import SpectatorHub, recv_frame_bytes, shard_request
+
+# --- SPECTATOR RELAY ---
+# Subscribes ONCE to a match's tick stream (the game server's spectator port,
+# or another relay) and re-broadcasts every frame to many spectators.
+# Frames are forwarded as raw bytes: no unpickling, no re-encoding.
+# The listening side speaks exactly what the upstream speaks, so relays chain:
+#   server:5557 -> relay A:5558 -> relay B:5559 -> ... -> client.py (SPECTATE)
+# With several engine shards the first relay picks the match (--shard); the
+# rest of the chain passes that one stream on whatever shard they ask for.
+UPSTREAM_HOST = "127.0.0.1"
+UPSTREAM_PORT = 5557
+HOST = "0.0.0.0"
+PORT = 5558
+RECONNECT_DELAY = 1.0
+STATS_INTERVAL = 10.0
+
+
+class Relay:
+    def __init__(self, upstream, shard=0):
+        self.upstream = upstream
+        self.shard = shard
+        self.spectators = SpectatorHub("relay")   # ONE writer thread, however many watch
+        self.latest = None          # Last frame, handed to late joiners straight away
+        self.frames_in = 0
+
+    def add(self, conn):
+        return self.spectators.add(conn, self.latest)
+
+    def broadcast(self, frame):
+        self.latest = frame
+        self.frames_in += 1
+        self.spectators.broadcast(frame)   # Never blocks: slow spectators drop stale frames
+
+    def upstream_loop(self):
+        """Keeps ONE connection upstream; reconnects without dropping spectators"""
+        while True:
+            try:
+                sock = socket.create_connection(self.upstream)
+                sock.sendall(shard_request(self.shard))
+                print(f"[RELAY] Subscribed to {self.upstream[0]}:{self.upstream[1]} (shard {self.shard})")
+                while True:
+                    frame = recv_frame_bytes(sock)
+                    if frame is None: break
+                    self.broadcast(frame)
+                sock.close()
+                print("[RELAY] Upstream closed")
+            except OSError as e:
+                print(f"[RELAY] Upstream Error: {e}")
+            time.sleep(RECONNECT_DELAY)
+
+    def stats_loop(self):
+        while True:
+            time.sleep(STATS_INTERVAL)
+            targets = self.spectators.values()
+            dropped = sum(c.frames_dropped for c in targets)
+            print(f"[RELAY] spectators={len(targets)} frames_in={self.frames_in} dropped_now={dropped}")
+
+
+def start_relay(upstream_host=UPSTREAM_HOST, upstream_port=UPSTREAM_PORT, host=HOST, port=PORT, shard=0):
+    relay = Relay((upstream_host, upstream_port), shard)
+    threading.Thread(target=relay.upstream_loop, daemon=True).start()
+    threading.Thread(target=relay.stats_loop, daemon=True).start()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(128)
+    print(f"[RELAY] Listening for spectators on {host}:{port}")
+
+    while True:
+        conn, addr = server.accept()
+        relay.add(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel Snake spectator relay")
+    parser.add_argument("--upstream", default=f"{UPSTREAM_HOST}:{UPSTREAM_PORT}", help="Server spectator port or another relay, host:port")
+    parser.add_argument("--port", type=int, default=PORT, help="Port spectators (or downstream relays) connect to")
+    parser.add_argument("--shard", type=int, default=0, help="Engine shard (match) to watch when the upstream is the server")
+    args = parser.parse_args()
+    up_host, up_port = args.upstream.rsplit(":", 1)
+    start_relay(up_host, int(up_port), port=args.port, shard=args.shard)
@@ -1,63 +1,79 @@
 import socket
 import time
 import multiprocessing
+import multiprocessing.connection
 import pickle
 import struct
-import random
 import threading
-import queue # Import standard queue for local exceptions
 import os
+import argparse
+
+import board
+import interest
+import metrics
+import profiler
+from connection import ClientConnection, SpectatorHub, encode_frame, recv_exact, FRAME_RATE
+import udp_transport
+import framecodec
+import ai_search
+import input_ring
+import gamestate
+import topology
+import latency
+import telemetry
+import checkpoint
 
 HOST = "0.0.0.0" 
 PORT = 5555
-GRID_SIZE = 20
-GAME_WIDTH, GAME_HEIGHT = 1000, 1000
-GRID_W = GAME_WIDTH // GRID_SIZE
-GRID_H = GAME_HEIGHT // GRID_SIZE
+SPECTATOR_PORT = 5557  # Full-state stream for relays (see relay.py); players use PORT
 
 # --- HELPER FUNCTIONS ---
-def send_data(sock, data):
-    try:
-        serialized = pickle.dumps(data)
-        sock.sendall(struct.pack('>I', len(serialized)) + serialized)
-    except: pass
-
 def receive_data(sock):
     try:
-        header = sock.recv(4)
+        header = recv_exact(sock, 4)
         if not header: return None
         msg_len = struct.unpack('>I', header)[0]
-        data = b""
-        while len(data) < msg_len:
-            packet = sock.recv(msg_len - len(data))
-            if not packet: return None
-            data += packet
+        data = recv_exact(sock, msg_len)
+        if data is None: return None
         return pickle.loads(data)
     except: return None
 
-def respawn_player(pid):
-    sx = random.randint(5, GRID_W-5) * GRID_SIZE
-    sy = random.randint(5, GRID_H-5) * GRID_SIZE
-    return [(sx, sy), (sx+GRID_SIZE, sy)]
-
-def generate_new_food():
-    x = random.randint(2, GRID_W - 2) * GRID_SIZE
-    y = random.randint(2, GRID_H - 2) * GRID_SIZE
-    return (x, y)
+def respawn_all(match):
+    """Puts every player back on a fresh spot and stops them. Returns the occupancy map."""
+    occupied = {}
+    for pid in match.players:
+        for segment in match.spawn(pid, occupied).snake.body:
+            occupied[segment] = pid
+    return occupied
 
 # --- PROCESS 3: AI BOT (Real Parallelism) ---
-def ai_player_process(shared_return_dict, input_queue):
-    print("[AI] Bot Process Started")
+# mode "bfs": shortest path to the food, anytime search only when there's no path
+# mode "search": anytime search every tick (see ai_search.py)
+AI_MODES = ("bfs", "search")
+AI_PID = 99       # Extra bots in the same shard count down from here
+
+def ai_player_process(shared_return_dict, input_channel, ai_mode="bfs", budget=ai_search.SEARCH_BUDGET_FRACTION,
+                      shard=0, bot_pid=AI_PID, name="ai", cpus=None):
+    topology.start_worker(shared_return_dict, name, "ai", cpus)
+    print(f"[AI] Bot Process Started (mode={ai_mode}, budget={budget:.0%} of tick, shard {shard}, P{bot_pid})")
     pid = os.getpid()
-    shared_return_dict['compute_pid'] = pid
+    shared_return_dict[topology.shard_key('compute_pid', shard)] = pid
     
-    # AI ID
-    AI_PID = 99
     is_playing = False
+    publisher = metrics.Publisher(shared_return_dict, name)
+    prof = profiler.SamplingProfiler(name)
+    profiler.install_signal_toggle(prof)
+    prof_control = profiler.ControlPoller(shared_return_dict, prof)
+    path_cache = ai_search.PathCache()
     
     while True:
         try:
-            state = shared_return_dict.get('game_state')
+            tick_start = time.perf_counter()
+            deadline = tick_start + budget * ai_search.TICK_INTERVAL
+            publisher.tick()
+            prof_control.tick()
+            with metrics.timer("manager_read_ms", key="game_state"):
+                state = shared_return_dict.get(topology.shard_key('game_state', shard))
             if not state:
                 time.sleep(0.1)
                 continue
@@ -68,7 +84,7 @@ def ai_player_process(shared_return_dict, input_queue):
             if mode == "PVP":
                 if is_playing:
                     # Leave the game
-                    input_queue.put((AI_PID, "DISCONNECT"))
+                    input_channel.put(bot_pid, "DISCONNECT")
                     is_playing = False
                     print("[AI] Mode is PVP. Bot sleeping.")
                 time.sleep(1)
@@ -77,7 +93,7 @@ def ai_player_process(shared_return_dict, input_queue):
             # Mode is PVAI
             if not is_playing:
                 # Join the game
-                input_queue.put((AI_PID, "NEW_PLAYER"))
+                input_channel.put(bot_pid, "NEW_PLAYER")
                 is_playing = True
                 print("[AI] Mode is PVAI. Bot joining.")
                 time.sleep(1) # Wait for join
@@ -87,287 +103,650 @@ def ai_player_process(shared_return_dict, input_queue):
                 time.sleep(0.1)
                 continue
             
-            # Get my snake and food
-            my_snake = state["players"].get(AI_PID)
-            food = state["food"]
+            # Get my snake
+            my_snake = state["players"].get(bot_pid)
             
             if not my_snake:
                 # Try to respawn if dead
-                input_queue.put((AI_PID, "NEW_PLAYER"))
+                input_channel.put(bot_pid, "NEW_PLAYER")
                 time.sleep(1)
                 continue
 
-            head = my_snake[-1]
-            
-            # BFS Pathfinding
-            queue_bfs = [(head, [])]
-            visited = set()
-            visited.add(head)
-            
-            # Obstacles (Walls + Other Snakes)
-            obstacles = set()
-            for p, s in state["players"].items():
-                for segment in s:
-                    obstacles.add(segment)
-            
-            # Remove own tail from obstacles (it will move)
-            if my_snake[0] in obstacles:
-                obstacles.remove(my_snake[0])
-
             best_move = None
-            nodes_searched = 0
-            
-            while queue_bfs:
-                current, path = queue_bfs.pop(0)
-                nodes_searched += 1
-                
-                if current == food:
-                    if path: best_move = path[0]
-                    break
-                
-                cx, cy = current
-                # Check 4 directions
-                for dx, dy, move in [(0, -1, (0,-1)), (0, 1, (0,1)), (-1, 0, (-1,0)), (1, 0, (1,0))]:
-                    nx, ny = cx + dx * GRID_SIZE, cy + dy * GRID_SIZE
-                    neighbor = (nx, ny)
-                    
-                    # Bounds Check
-                    if not (0 <= nx < GAME_WIDTH and 0 <= ny < GAME_HEIGHT):
-                        continue
-                        
-                    # Obstacle Check
-                    if neighbor in obstacles:
-                        continue
-                        
-                    if neighbor not in visited:
-                        visited.add(neighbor)
-                        new_path = list(path)
-                        new_path.append(move)
-                        queue_bfs.append((neighbor, new_path))
+            search_start = time.perf_counter()
+            depth = nodes_searched = 0
+
+            if ai_mode == "bfs":
+                # Cached path to the food: most ticks are a few dict lookups, not a BFS
+                best_move, replan_reason = path_cache.next_move(state, bot_pid, deadline)
+                nodes_searched = path_cache.last_nodes
+                if path_cache.timed_out: metrics.inc("ai_path_timeouts")
+                depth = path_cache.steps_left(state, bot_pid)
+                if replan_reason is None:
+                    metrics.inc("ai_path_cache", result="hit")
+                else:
+                    metrics.inc("ai_path_cache", result="miss")
+                    metrics.inc("ai_path_replans", reason=replan_reason)
+
+            if best_move is None:
+                # No path to the food (or search mode): spend what's left of the budget.
+                # After a BFS that ran out of time that's none: the depth-0 safe move.
+                best_move, stats = ai_search.plan_move(state, bot_pid, deadline)
+                nodes_searched += stats.nodes
+                depth = stats.depth
+                metrics.gauge("ai_search_depth", stats.depth)
             
             # Update Stats
-            shared_return_dict['compute_count'] = nodes_searched
+            search_s = time.perf_counter() - search_start
+            metrics.observe("ai_search_ms", search_s * 1000)
+            metrics.inc("ai_nodes_searched", nodes_searched)
+            shared_return_dict[topology.shard_key('compute_count', shard)] = {
+                "nodes": nodes_searched,
+                "depth": depth,
+                "nodes_per_sec": int(nodes_searched / search_s) if search_s > 0 else 0,
+                "cache_hits": path_cache.hits,
+                "cache_misses": path_cache.misses,
+            }
             
             if best_move:
-                input_queue.put((AI_PID, best_move))
-            else:
-                # Fallback: Random valid move if no path found
-                pass
+                input_channel.put(bot_pid, best_move)
                 
-            # AI thinks at 10Hz (same as game tick)
-            time.sleep(0.1)
+            # AI thinks at the game tick rate: sleep off whatever the search didn't use
+            time.sleep(max(0.0, ai_search.TICK_INTERVAL - (time.perf_counter() - tick_start)))
             
         except Exception as e:
             print(f"[AI] Error: {e}")
             time.sleep(1)
 
 # --- PROCESS 2: PHYSICS ENGINE (True Parallelism) ---
-def game_engine_process(shared_return_dict, input_queue):
-    print("[ENGINE] Physics Process Started")
-    engine_pid = os.getpid()
+def game_engine_process(shared_return_dict, input_channel, board_w=board.DEFAULT_BOARD_W, board_h=board.DEFAULT_BOARD_H,
+                        shard=0, name="engine", cpus=None, restore=False):
+    topology.start_worker(shared_return_dict, name, "engine", cpus)
+    print(f"[ENGINE] Physics Process Started ({board_w}x{board_h} cells, shard {shard})")
+    state_key = topology.shard_key('game_state', shard)
+    checkpoint_key = topology.shard_key('engine_checkpoint', shard)
+    # Dashboard telemetry is read from here by the network process (telemetry.py)
+    shared_return_dict[topology.shard_key('engine_pid', shard)] = os.getpid()
     
-    local_state = {
-        "players": {},
-        "scores": {},
-        "food": (100, 100),
-        "status": "WAITING",
-        "game_mode": "PVP",
-        "countdown": 3,
-        "timer_start": None,
-        "winner": None,
-        "game_over_time": None,
-        "debug_info": {"engine_pid": engine_pid}
-    }
+    match = gamestate.Match(board_w, board_h)
+    pending_board = None   # "BOARD:WxH" requests apply at the next round start
+    # Restarted by the supervisor: carry on from the last published state, or
+    # (restore=False) start over with the same players. Either way before the
+    # first drain, so a DISCONNECT queued while the shard was down still applies.
+    last_state = shared_return_dict.get(state_key)
+    if last_state and restore:
+        match, pending_board = checkpoint.restore(last_state, shared_return_dict.get(checkpoint_key))
+        print(f"[ENGINE] Restored shard {shard} at tick {match.tick} ({len(match.players)} players, {match.status})")
+    elif last_state:
+        match = checkpoint.rejoin(last_state, board_w, board_h)
+        print(f"[ENGINE] Started shard {shard} clean ({len(match.players)} players re-joined)")
+    players = match.players
     
-    player_inputs = {}
+    occupied = match.occupancy()   # cell -> pid, kept in sync with every snake
+    checkpointer = checkpoint.Checkpointer(shared_return_dict, checkpoint_key)
+    ready_key = topology.shard_key('engine_ready', shard)
+    ready = False
+    publisher = metrics.Publisher(shared_return_dict, name)
+    prof = profiler.SamplingProfiler(name)
+    profiler.install_signal_toggle(prof)
+    prof_control = profiler.ControlPoller(shared_return_dict, prof)
 
     while True:
-        # Update Debug Info
-        local_state["debug_info"]["server_pid"] = shared_return_dict.get('server_pid', 'Unknown')
-        local_state["debug_info"]["compute_pid"] = shared_return_dict.get('compute_pid', 'Unknown')
-        local_state["debug_info"]["compute_cycles"] = shared_return_dict.get('compute_count', 0)
+        tick_start = time.perf_counter()
+        match.tick += 1
+        tick_time = time.time()   # What input acks report as "applied at"
 
         # 1. READ ALL INPUTS
-        while not input_queue.empty():
+        # One drain per tick: every input since the last one, in arrival order
+        inputs = input_channel.drain()
+        metrics.observe("input_batch_size", len(inputs))
+        metrics.inc("engine_inputs", len(inputs))
+        for pid, direction, seq in inputs:
             try:
-                pid, direction = input_queue.get_nowait()
-                
                 if isinstance(direction, str) and direction.startswith("MODE:"):
-                    local_state["game_mode"] = direction.split(":")[1]
+                    match.game_mode = direction.split(":")[1]
+                    continue
+
+                if isinstance(direction, str) and direction.startswith("BOARD:"):
+                    pending_board = board.parse_board_size(direction.split(":")[1])
                     continue
 
                 if direction == "NEW_PLAYER":
-                    local_state["players"][pid] = respawn_player(pid)
-                    local_state["scores"][pid] = 0
-                    player_inputs[pid] = (0,0)
+                    if pid in players:
+                        for segment in players[pid].snake.body: occupied.pop(segment, None)
+                    player = match.spawn(pid, occupied)
+                    for segment in player.snake.body: occupied[segment] = pid
+                    player.score = 0
                 elif direction == "DISCONNECT":
-                    if pid in local_state["players"]: del local_state["players"][pid]
-                else:
-                    player_inputs[pid] = direction
+                    if pid in players:
+                        for segment in players[pid].snake.body: occupied.pop(segment, None)
+                        match.remove(pid)
+                elif pid in players:
+                    player = players[pid]
+                    player.direction = direction
+                    if seq: player.ack = (seq, match.tick, tick_time)
             except: pass
 
         # 2. GAME LOGIC
-        if len(local_state["players"]) < 2:
-            local_state["status"] = "WAITING"
-            local_state["timer_start"] = None
+        if len(players) < 2:
+            match.status = gamestate.WAITING
+            match.timer_start = None
             
-        elif local_state["status"] == "WAITING" and len(local_state["players"]) >= 2:
-            local_state["status"] = "COUNTDOWN"
-            local_state["timer_start"] = time.time()
+        elif match.status == gamestate.WAITING and len(players) >= 2:
+            match.status = gamestate.COUNTDOWN
+            match.timer_start = time.time()
             
+            if pending_board:
+                match.board_w, match.board_h = pending_board
+                pending_board = None
+
             # --- FIX 1: CLEAR INPUTS ON START ---
-            for pid in local_state["players"]:
-                local_state["players"][pid] = respawn_player(pid)
-                local_state["scores"][pid] = 0
-                player_inputs[pid] = (0,0) # Force stop moving
+            occupied = respawn_all(match)
+            match.reset_scores()
+            match.new_food(occupied)
 
-        elif local_state["status"] == "COUNTDOWN":
-            elapsed = time.time() - local_state["timer_start"]
-            if elapsed < 3: local_state["countdown"] = 3 - int(elapsed)
-            else: local_state["status"] = "RUNNING"
+        elif match.status == gamestate.COUNTDOWN:
+            elapsed = time.time() - match.timer_start
+            if elapsed < 3: match.countdown = 3 - int(elapsed)
+            else: match.status = gamestate.RUNNING
 
-        elif local_state["status"] == "RUNNING":
+        elif match.status == gamestate.RUNNING:
             collision_detected = False
             round_winner = None
+            board_w, board_h = match.board_w, match.board_h
             
             next_positions = {}
-            for pid, snake in local_state["players"].items():
-                head_x, head_y = snake[-1]
-                dx, dy = player_inputs.get(pid, (0,0))
+            for pid, player in players.items():
+                body = player.snake.body
+                head_x, head_y = body[-1]
+                dx, dy = player.direction
                 
                 # --- FIX 2: NECK CHECK (Prevent 180 Turns) ---
-                if len(snake) > 1:
-                    neck_x, neck_y = snake[-2]
+                if len(body) > 1:
                     # If input tries to go backwards into neck, ignore it
-                    if (head_x + dx * GRID_SIZE, head_y + dy * GRID_SIZE) == (neck_x, neck_y):
+                    if (head_x + dx, head_y + dy) == body[-2]:
                         dx, dy = 0, 0 # Stop instead of crashing
                 
                 if dx == 0 and dy == 0: 
-                    next_positions[pid] = snake[-1]
+                    next_positions[pid] = body[-1]
                     continue
                 
-                new_head = (head_x + dx * GRID_SIZE, head_y + dy * GRID_SIZE)
-                next_positions[pid] = new_head
+                next_positions[pid] = (head_x + dx, head_y + dy)
 
-            # Check Collisions
+            # Check Collisions (occupancy lookup instead of scanning every body)
             for pid, new_head in next_positions.items():
                 # Wall
-                if not (0 <= new_head[0] < GAME_WIDTH and 0 <= new_head[1] < GAME_HEIGHT):
+                if not (0 <= new_head[0] < board_w and 0 <= new_head[1] < board_h):
                     collision_detected = True
                     round_winner = "Draw"
                     break
                 
-                # Body
-                for other_pid, other_snake in local_state["players"].items():
-                    body_to_check = other_snake[:-1] if other_pid == pid else other_snake
-                    if new_head in body_to_check:
-                        collision_detected = True
-                        round_winner = other_pid if other_pid != pid else "Draw"
-                        break
-                if collision_detected: break
+                # Body (own head doesn't count: that's a stationary snake)
+                owner = occupied.get(new_head)
+                if owner is not None and not (owner == pid and new_head == players[pid].snake.body[-1]):
+                    collision_detected = True
+                    round_winner = owner if owner != pid else "Draw"
+                    break
             
             if collision_detected:
-                local_state["status"] = "GAME_OVER"
-                local_state["winner"] = round_winner if round_winner else "Draw"
-                local_state["game_over_time"] = time.time()
+                match.status = gamestate.GAME_OVER
+                match.winner = round_winner if round_winner else "Draw"
+                match.game_over_time = time.time()
             else:
                 # Apply Moves
-                for pid, snake in local_state["players"].items():
+                for pid, player in players.items():
                     if pid not in next_positions: continue
+                    body = player.snake.body
                     new_head = next_positions[pid]
-                    if new_head == snake[-1]: continue 
+                    if new_head == body[-1]: continue 
 
-                    snake.append(new_head)
-                    if new_head == local_state["food"]:
-                        local_state["food"] = generate_new_food()
-                        local_state["scores"][pid] += 10
+                    body.append(new_head)
+                    occupied[new_head] = pid
+                    if new_head == match.food:
+                        player.score += 10
+                        match.new_food(occupied)
                     else:
-                        snake.pop(0)
-                    local_state["players"][pid] = snake
+                        tail = body.popleft()
+                        if occupied.get(tail) == pid: del occupied[tail]
 
-        elif local_state["status"] == "GAME_OVER":
-            if time.time() - local_state["game_over_time"] > 3:
+        elif match.status == gamestate.GAME_OVER:
+            if time.time() - match.game_over_time > 3:
                 # Restart Game
-                local_state["status"] = "COUNTDOWN"
-                local_state["timer_start"] = time.time()
-                local_state["winner"] = None
+                match.status = gamestate.COUNTDOWN
+                match.timer_start = time.time()
+                match.winner = None
+
+                if pending_board:
+                    match.board_w, match.board_h = pending_board
+                    pending_board = None
                 
                 # --- FIX 3: CLEAR INPUTS ON RESTART ---
-                for pid in local_state["players"]:
-                    local_state["players"][pid] = respawn_player(pid)
-                    # local_state["scores"][pid] = 0 # Optional: reset scores
-                    player_inputs[pid] = (0,0) # CRITICAL: Reset inputs to stationary
+                # match.reset_scores() # Optional: reset scores
+                occupied = respawn_all(match) # CRITICAL: Reset inputs to stationary
+                match.new_food(occupied)
+
+        with metrics.timer("manager_write_ms", key="game_state"):
+            shared_return_dict[state_key] = match.snapshot()
+        checkpointer.offer(checkpoint.capture(match, pending_board))
+        if not ready:
+            # First tick is out: this is what the supervisor times recovery against
+            shared_return_dict[ready_key] = (os.getpid(), time.time(), match.tick)
+            ready = True
 
-        shared_return_dict['game_state'] = local_state
+        metrics.observe("engine_tick_ms", (time.perf_counter() - tick_start) * 1000)
+        metrics.inc("engine_ticks")
+        metrics.gauge("engine_players", len(players))
+        publisher.tick()
+        prof_control.tick()
         time.sleep(0.1)
 
+# --- ENGINE SUPERVISOR ---
+# Runs in the network process. When an engine dies (crash, kill, or a deploy
+# via GET /engine?action=restart) a new one starts on the same input ring and
+# carries on from the last published state + checkpoint (checkpoint.py).
+# Clients stay connected and just see the board pause. Recovery time runs from
+# noticing the death to the new engine's first published tick.
+# Engines start from a forkserver: by the time one needs replacing this process
+# is running network threads, and forking it could copy a lock some thread holds.
+RECOVERY_TIMEOUT = 5.0
+CRASH_LOOP_WINDOW = 2.0   # Crashed again this soon after the last crash: start clean instead
+ENGINE_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+class EngineSupervisor:
+    def __init__(self, shared_return_dict, channels, board_w, board_h, pins, context):
+        self.shared = shared_return_dict
+        self.context = context    # Start method context the input rings were made in
+        self.channels = channels
+        self.board_size = (board_w, board_h)
+        self.pins = pins
+        self.processes = {}       # shard -> multiprocessing.Process
+        self.crashed_at = {}      # shard -> time of the last crash (not deploys or shutdown)
+        self.requested = set()    # Shards restart() is stopping on purpose
+        self.reports = {}         # shard -> last recovery line
+        self.recoveries = 0
+        self.recovered = threading.Condition()
+        self.stopping = False
+
+    def start(self, shard, restore=False):
+        engines = len(self.channels)
+        process = self.context.Process(target=game_engine_process, args=(
+            self.shared, self.channels[shard], *self.board_size,
+            shard, topology.worker_name("engine", shard), topology.cpus_for(self.pins, "engine", shard, engines), restore))
+        process.daemon = True
+        process.start()
+        self.processes[shard] = process
+        return process
+
+    def watch(self):
+        """Supervisor thread: sleeps on the engines' sentinels, restarts whichever dies"""
+        while not self.stopping:
+            by_sentinel = {process.sentinel: shard for shard, process in self.processes.items()}
+            for sentinel in multiprocessing.connection.wait(list(by_sentinel), timeout=1.0):
+                if self.stopping: return
+                try: self.recover(by_sentinel[sentinel])
+                except Exception as e: print(f"[SUPERVISOR] Error: {e}")
+
+    def recover(self, shard):
+        died_at = time.time()
+        dead = self.processes[shard]
+        dead.join()
+        last_state = self.shared.get(topology.shard_key('game_state', shard)) or {}
+        last_checkpoint = self.shared.get(topology.shard_key('engine_checkpoint', shard)) or {}
+        if self.channels[shard].recover():
+            print(f"[SUPERVISOR] Engine shard {shard} died holding its input ring lock: freed")
+
+        # Crashing again right after a crash restore is probably the restored
+        # state's fault. Deploy restarts and clean exits don't count.
+        crashed = dead.exitcode != 0 and shard not in self.requested
+        self.requested.discard(shard)
+        restore = not (crashed and died_at - self.crashed_at.get(shard, 0) <= CRASH_LOOP_WINDOW)
+        if crashed: self.crashed_at[shard] = died_at
+        if not restore:
+            print(f"[SUPERVISOR] Engine shard {shard} crashed again within {CRASH_LOOP_WINDOW}s: starting it clean")
+        process = self.start(shard, restore)
+        metrics.inc("engine_restarts", shard=shard)
+
+        ready = self._wait_ready(shard, process.pid)
+        if ready is None:
+            report = f"engine shard {shard} (pid {dead.pid}, exit {dead.exitcode}) not back after {RECOVERY_TIMEOUT:.0f}s"
+        else:
+            _, ready_at, resumed_tick = ready
+            recovery_ms = (ready_at - died_at) * 1000
+            metrics.observe("engine_recovery_ms", recovery_ms, shard=shard)
+            if restore:
+                checkpoint_lag = last_state.get("tick", 0) - last_checkpoint.get("tick", 0)
+                metrics.gauge("engine_checkpoint_lag_ticks", checkpoint_lag, shard=shard)
+                resumed = f"checkpoint {checkpoint_lag} tick(s) behind"
+            else:
+                resumed = "started clean, players re-joined"
+            report = (f"engine shard {shard} (pid {dead.pid}, exit {dead.exitcode}) back in {recovery_ms:.0f} ms "
+                      f"as pid {process.pid}, tick {resumed_tick}, {resumed}")
+        print(f"[SUPERVISOR] {report}")
+        with self.recovered:
+            self.reports[shard] = report
+            self.recoveries += 1
+            self.recovered.notify_all()
+
+    def _wait_ready(self, shard, pid):
+        ready_key = topology.shard_key('engine_ready', shard)
+        deadline = time.time() + RECOVERY_TIMEOUT
+        while time.time() < deadline:
+            ready = self.shared.get(ready_key)
+            if ready and ready[0] == pid: return ready
+            time.sleep(0.002)
+        return None
+
+    def stop(self):
+        """Shutting down: the engines are about to be terminated, don't replace them"""
+        self.stopping = True
+
+    def restart(self, shard):
+        """Deploy path: stop the engine and wait for the supervisor to bring it back"""
+        process = self.processes.get(shard)
+        if process is None: return f"no engine shard {shard}\n"
+        with self.recovered:
+            seen = self.recoveries
+            self.requested.add(shard)
+            process.terminate()
+            self.recovered.wait_for(lambda: self.recoveries > seen, timeout=RECOVERY_TIMEOUT + 1)
+        return self.reports.get(shard, f"engine shard {shard} restarting") + "\n"
+
+    def handle_control(self, query):
+        """GET /engine: status, or ?action=restart&shard=N"""
+        try: shard = int(query.get("shard", 0))
+        except ValueError: return "shard must be a number\n"
+        if query.get("action") == "restart": return self.restart(shard)
+        lines = [f"engine shard {s}: pid {p.pid} {'alive' if p.is_alive() else 'dead'}" for s, p in sorted(self.processes.items())]
+        lines += [f"last recovery: {report}" for _, report in sorted(self.reports.items())]
+        return "\n".join(lines) + "\n"
+
+# --- INPUT ROUTING ---
+class InputRouter:
+    """Same put() as InputRing, but each player goes to the engine running their shard.
+    Players fill shards match_size at a time (1-2 -> shard 0, 3-4 -> shard 1, ...)."""
+
+    def __init__(self, channels, match_size=topology.MATCH_SIZE):
+        self.channels = channels
+        self.match_size = match_size
+
+    def shard_of(self, pid):
+        return ((pid - 1) // self.match_size) % len(self.channels)
+
+    def put(self, pid, message, seq=0):
+        return self.channels[self.shard_of(pid)].put(pid, message, seq)
+
+def next_player_id(counter):
+    """TCP and UDP players in every network worker share one id sequence"""
+    with counter.get_lock():
+        counter.value += 1
+        return counter.value
+
 # --- THREAD: INPUT LISTENER ---
 # Continually listens for keys from ONE client
-def client_input_thread(conn, pid, input_queue):
+def handle_client_message(pid, message, input_channel, client_views, client_latency, dashboard):
+    """Shared by the TCP input threads and the UDP server"""
+    # Viewport requests, telemetry subscriptions and pings stay in the network process
+    if isinstance(message, str) and message.startswith("VIEW:"):
+        try: client_views[pid] = interest.parse_view_size(message.split(":")[1])
+        except ValueError: pass
+        return
+    if telemetry.is_request(message):
+        dashboard.handle(pid, message)
+        return
+    if latency.is_ping(message):
+        client_latency.setdefault(pid, latency.PlayerLatency()).on_ping(pid, message, time.time())
+        return
+    if latency.is_move(message):
+        _, seq, direction, _ = message
+        if type(seq) is not int: return
+        client_latency.setdefault(pid, latency.PlayerLatency()).on_input(seq, time.time())
+        input_channel.put(pid, direction, seq)
+        return
+    input_channel.put(pid, message)
+
+def client_input_thread(client, input_channel, client_views, client_latency, dashboard):
+    pid = client.pid
     try:
         while True:
-            direction = receive_data(conn)
+            direction = receive_data(client.conn)
             if direction is None: break
-            input_queue.put((pid, direction))
-    except: pass
+            # Compression is negotiated per connection, right after connecting
+            if isinstance(direction, str) and direction.startswith("CODEC:"):
+                client.compress = (direction.split(":", 1)[1] == framecodec.CODEC_NAME)
+                continue
+            handle_client_message(pid, direction, input_channel, client_views, client_latency, dashboard)
+    except Exception as e:
+        print(f"[NET] Player {pid} Input Error: {e}")
     finally:
-        input_queue.put((pid, "DISCONNECT"))
+        input_channel.put(pid, "DISCONNECT")
+        client_views.pop(pid, None)
+        client_latency.pop(pid, None)
+        dashboard.forget(pid)
+        client.close("input closed")
         print(f"[NET] Player {pid} Input Stopped")
 
-# --- THREAD: STATE SENDER ---
-# Continually sends the map to ONE client (Fixes the lag!)
-def client_output_thread(conn, shared_return_dict):
-    try:
-        while True:
-            # Grab the latest state from the Engine Process
-            state = shared_return_dict.get('game_state')
-            if state:
-                send_data(conn, state)
-            time.sleep(0.05) # Send updates 20 times/sec
-    except: pass
-
-def start_server():
-    # Setup Multiprocessing
-    manager = multiprocessing.Manager()
-    shared_return_dict = manager.dict()
-    shared_return_dict['game_state'] = {}
-    shared_return_dict['server_pid'] = os.getpid()
-    shared_return_dict['compute_count'] = 0
-    
-    input_queue = multiprocessing.Queue()
+# --- THREAD: SNAPSHOT READER ---
+# Reads the engine state ONCE per frame, builds the spatial index and hands each
+# client its own view. Pushing never blocks: slow clients just drop stale frames.
+def snapshot_thread(shared_return_dict, clients, client_views, client_latency, dashboard, spectators, router, spectator_compress=False, prof_control=None):
+    shard_keys = [topology.shard_key('game_state', shard) for shard in range(len(router.channels))]
+    while True:
+        try:
+            # Extra network workers have no /profile endpoint of their own
+            if prof_control: prof_control.tick()
+            states, indexes = {}, {}
+            with metrics.timer("manager_read_ms", key="game_state"):
+                for shard, key in enumerate(shard_keys):
+                    state = shared_return_dict.get(key)
+                    if state: states[shard] = state
+            with metrics.timer("net_index_build_ms"):
+                for shard, state in states.items():
+                    indexes[shard] = interest.build_bucket_index(state["players"])
+            with metrics.timer("net_view_filter_ms"):
+                now = time.time()
+                for pid, client in list(clients.items()):
+                    shard = router.shard_of(pid)
+                    if shard not in states: continue
+                    view_w, view_h = client_views.get(pid, (interest.DEFAULT_VIEW_W, interest.DEFAULT_VIEW_H))
+                    view = interest.filter_state(states[shard], indexes[shard], pid, view_w, view_h)
+                    tracker = client_latency.get(pid)
+                    if tracker: tracker.on_frame(pid, view, now)
+                    dashboard.attach(pid, shard, view)
+                    client.push(view)
+            metrics.gauge("net_clients_connected", len(clients))
 
-    # Start Physics Engine Process
-    p_engine = multiprocessing.Process(target=game_engine_process, args=(shared_return_dict, input_queue))
-    p_engine.daemon = True
-    p_engine.start()
+            # Relays get the whole board of the shard they asked for (SHARD:n, default 0),
+            # encoded once per watched shard no matter how many are attached
+            if spectators:
+                for shard in spectators.watched():
+                    if shard not in states: continue
+                    with metrics.timer("net_serialize_ms", stream="spectator"):
+                        payload = encode_frame(states[shard], spectator_compress, stream="spectator")
+                    spectators.broadcast(payload, shard)
+            if spectators is not None: metrics.gauge("net_spectators_connected", len(spectators))
+        except Exception as e:
+            print(f"[NET] Snapshot Error: {e}")
+        time.sleep(1 / FRAME_RATE) # Send updates 20 times/sec
 
-    # Start AI Bot Process (Replaces Heavy Compute)
-    p_ai = multiprocessing.Process(target=ai_player_process, args=(shared_return_dict, input_queue))
-    p_ai.daemon = True
-    p_ai.start()
+# --- THREAD: SPECTATOR ACCEPT ---
+# Relays (or a few direct viewers) subscribe here; they never become players
+def spectator_accept_thread(port, spectators):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((HOST, port))
+    server.listen(128)
+    print(f"[NET] Spectator Stream on {HOST}:{port}")
 
+    while True:
+        conn, addr = server.accept()
+        spectator = spectators.add(conn)
+        print(f"[NET] Spectator {spectator.pid} Connected ({addr[0]})")
+
+# --- THREAD: STATE SENDER ---
+# Drains ONE client's send queue with a write timeout (see connection.py)
+def client_output_thread(client, clients):
+    try:
+        client.writer_loop()
+    finally:
+        clients.pop(client.pid, None)
+
+def listen_socket(port=PORT, reuse_port=False):
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    server.bind((HOST, PORT))
+    # Several network workers bind the same port; the kernel spreads connections
+    if reuse_port: server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.bind((HOST, port))
     server.listen()
-    print(f"[MAIN] Server Listening on {HOST}:{PORT}")
-    print(f"[MAIN] Server PID: {os.getpid()}")
+    return server
 
-    player_count = 0
-    
+def accept_loop(server, input_channel, player_ids, clients, client_views, client_latency, dashboard):
     while True:
         conn, addr = server.accept()
-        player_count += 1
+        player_count = next_player_id(player_ids)
         print(f"[NET] Player {player_count} Connected")
         
         # Notify Engine
-        input_queue.put((player_count, "NEW_PLAYER"))
+        input_channel.put(player_count, "NEW_PLAYER")
         
+        client = ClientConnection(conn, player_count)
+        clients[player_count] = client
+
         # 1. Start Input Thread (Reads keys)
-        threading.Thread(target=client_input_thread, args=(conn, player_count, input_queue), daemon=True).start()
+        threading.Thread(target=client_input_thread, args=(client, input_channel, client_views, client_latency, dashboard), daemon=True).start()
         
         # 2. Start Output Thread (Sends map)
-        threading.Thread(target=client_output_thread, args=(conn, shared_return_dict), daemon=True).start()
+        threading.Thread(target=client_output_thread, args=(client, clients), daemon=True).start()
+
+# --- PROCESS 4+: EXTRA NETWORK WORKERS ---
+# TCP players only; spectators, UDP and /metrics stay in the main process
+def network_worker_process(shared_return_dict, router, player_ids, name, cpus=None):
+    topology.start_worker(shared_return_dict, name, "network", cpus)
+    metrics.start_publisher_thread(shared_return_dict, name)
+    prof = profiler.SamplingProfiler(name)
+    profiler.install_signal_toggle(prof)
+
+    clients = {}
+    client_views = {}
+    client_latency = {}
+    dashboard = telemetry.Telemetry(shared_return_dict, len(router.channels)).start()
+    prof_control = profiler.ControlPoller(shared_return_dict, prof)
+    threading.Thread(target=snapshot_thread, args=(shared_return_dict, clients, client_views, client_latency, dashboard, None, router),
+                     kwargs={"prof_control": prof_control}, daemon=True).start()
+    server = listen_socket(reuse_port=True)
+    print(f"[NET] {name} ({os.getpid()}) Listening on {HOST}:{PORT}")
+    accept_loop(server, router, player_ids, clients, client_views, client_latency, dashboard)
+
+def start_server(board_w=board.DEFAULT_BOARD_W, board_h=board.DEFAULT_BOARD_H, ai_mode="bfs", ai_budget=ai_search.SEARCH_BUDGET_FRACTION, spectator_port=SPECTATOR_PORT, spectator_compress=False, udp_port=0, udp_loss=0.0, metrics_port=metrics.METRICS_PORT, metrics_file=None, metrics_interval=10.0,
+                 workers=None, pins=None, match_size=topology.MATCH_SIZE):
+    workers = dict(workers or topology.DEFAULT_WORKERS)
+    pins = pins or {}
+    if workers["network"] > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("[TOPO] SO_REUSEPORT not available: running one network worker")
+        workers["network"] = 1
+    engines, networks = workers["engine"], workers["network"]
+
+    # Setup Multiprocessing
+    manager = multiprocessing.Manager()
+    shared_return_dict = manager.dict()
+    
+    # One input ring and one state key per engine shard
+    engine_context = multiprocessing.get_context(ENGINE_START_METHOD)
+    if ENGINE_START_METHOD == "forkserver":
+        # Import the game once in the forkserver, not again in every engine it forks
+        engine_context.set_forkserver_preload(["server"])
+    input_channels = [input_ring.InputRing(ctx=engine_context) for _ in range(engines)]
+    router = InputRouter(input_channels, match_size)
+
+    # Start Physics Engine Processes (supervised: restarted from checkpoint if they die)
+    supervisor = EngineSupervisor(shared_return_dict, input_channels, board_w, board_h, pins, engine_context)
+    for shard in range(engines):
+        shared_return_dict[topology.shard_key('game_state', shard)] = {}
+        shared_return_dict[topology.shard_key('compute_count', shard)] = {"nodes": 0, "depth": 0, "nodes_per_sec": 0}
+        supervisor.start(shard)
+
+    # Start AI Bot Processes (Replaces Heavy Compute), spread over the shards
+    for i in range(workers["ai"]):
+        shard = i % engines
+        p_ai = multiprocessing.Process(target=ai_player_process, args=(
+            shared_return_dict, input_channels[shard], ai_mode, ai_budget,
+            shard, AI_PID - i // engines, topology.worker_name("ai", i), topology.cpus_for(pins, "ai", i, workers["ai"])))
+        p_ai.daemon = True
+        p_ai.start()
+
+    # TCP and UDP players share one id sequence, across every network worker
+    player_ids = multiprocessing.Value("i", 0)
+    for i in range(1, networks):
+        p_net = multiprocessing.Process(target=network_worker_process, args=(
+            shared_return_dict, router, player_ids, topology.worker_name("network", i), topology.cpus_for(pins, "network", i, networks)))
+        p_net.daemon = True
+        p_net.start()
+
+    topology.start_worker(shared_return_dict, "network", "network", topology.cpus_for(pins, "network", 0, networks))
+    metrics.start_publisher_thread(None, "network")  # CPU gauges only; /metrics reads this registry directly
+
+    server = listen_socket(reuse_port=networks > 1)
+    print(f"[MAIN] Server Listening on {HOST}:{PORT}")
+    print(f"[MAIN] Server PID: {os.getpid()}")
+    print(f"[MAIN] Topology: {engines} engine, {workers['ai']} ai, {networks} network")
+
+    # Profiler for this (network) process; engine/AI have their own, toggled via the shared dict
+    # kill -USR1 <pid> or GET /profile?process=engine|ai|network&action=start|stop
+    prof = profiler.SamplingProfiler("network")
+    profiler.install_signal_toggle(prof)
+
+    # Metrics (0 disables the HTTP endpoint)
+    if metrics_port:
+        profile_route = lambda query: profiler.handle_control(shared_return_dict, prof, query.get("process", "network"), query.get("action", ""))
+        topology_route = lambda query: topology.render_report(shared_return_dict)
+        routes = {"/profile": profile_route, "/topology": topology_route, "/engine": supervisor.handle_control}
+        metrics.start_http_server(shared_return_dict, port=metrics_port, routes=routes)
+    if metrics_file:
+        metrics.start_file_dump(shared_return_dict, metrics_file, metrics_interval)
+
+    threading.Thread(target=supervisor.watch, name="supervisor", daemon=True).start()
+
+    # Network-side view of the world (shared by every client thread)
+    clients = {}
+    client_views = {}
+    client_latency = {}   # pid -> latency.PlayerLatency (pings, input timing)
+    dashboard = telemetry.Telemetry(shared_return_dict, engines).start()
+    spectators = SpectatorHub(shards=engines)   # One writer thread for every spectator (connection.py)
+    threading.Thread(target=snapshot_thread, args=(shared_return_dict, clients, client_views, client_latency, dashboard, spectators, router, spectator_compress), daemon=True).start()
+    if spectator_port:
+        threading.Thread(target=spectator_accept_thread, args=(spectator_port, spectators), daemon=True).start()
+
+    # Optional UDP transport (players join with a HELLO instead of a TCP connect)
+    if udp_port:
+        udp_server = udp_transport.UdpServer(
+            udp_port, clients, lambda: next_player_id(player_ids),
+            on_join=lambda pid: router.put(pid, "NEW_PLAYER"),
+            on_message=lambda pid, message: handle_client_message(pid, message, router, client_views, client_latency, dashboard),
+            on_leave=lambda pid: (router.put(pid, "DISCONNECT"), client_views.pop(pid, None), client_latency.pop(pid, None), dashboard.forget(pid)),
+            host=HOST, loss=udp_loss)
+        threading.Thread(target=udp_server.serve_forever, daemon=True).start()
+
+    try:
+        accept_loop(server, router, player_ids, clients, client_views, client_latency, dashboard)
+    finally:
+        supervisor.stop()
 
 if __name__ == "__main__":
-    start_server()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Parallel Snake server")
+    parser.add_argument("--board", default=f"{board.DEFAULT_BOARD_W}x{board.DEFAULT_BOARD_H}", help="Board size in cells, e.g. 500x500")
+    parser.add_argument("--ai-mode", choices=AI_MODES, default="bfs", help="bfs: chase the food, search only when cornered; search: anytime search every tick")
+    parser.add_argument("--ai-budget", type=float, default=ai_search.SEARCH_BUDGET_FRACTION, help="Fraction of the tick the AI may spend searching")
+    parser.add_argument("--spectator-port", type=int, default=SPECTATOR_PORT, help="Port relays subscribe to (0 disables); they send SHARD:n to watch engine shard n (default 0)")
+    parser.add_argument("--spectator-compress", action="store_true", help="Compress spectator frames (relays pass them through as-is)")
+    parser.add_argument("--udp-port", type=int, default=0, help=f"Also accept UDP players on this port (e.g. {udp_transport.UDP_PORT}; 0 disables)")
+    parser.add_argument("--udp-loss", type=float, default=0.0, help="Testing only: drop this fraction of outgoing UDP packets")
+    parser.add_argument("--metrics-port", type=int, default=metrics.METRICS_PORT, help="Local port for /metrics (0 disables)")
+    parser.add_argument("--metrics-file", default=None, help="Also dump metrics to this file periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="Seconds between metrics file dumps")
+    parser.add_argument("--workers", default="", help="Process counts, e.g. engine=2,ai=2,network=2 (default one of each)")
+    parser.add_argument("--pin", action="append", default=[], help="Pin a role to CPUs, e.g. --pin engine=2 --pin ai=4-7 (repeatable)")
+    parser.add_argument("--match-size", type=int, default=topology.MATCH_SIZE, help="Players per engine shard before the next shard fills")
+    args = parser.parse_args()
+    start_server(*board.parse_board_size(args.board), ai_mode=args.ai_mode, ai_budget=args.ai_budget, spectator_port=args.spectator_port, spectator_compress=args.spectator_compress,
+                 udp_port=args.udp_port, udp_loss=args.udp_loss, metrics_port=args.metrics_port,
+                 metrics_file=args.metrics_file, metrics_interval=args.metrics_interval,
+                 workers=topology.parse_workers(args.workers), pins=topology.parse_pins(args.pin), match_size=args.match_size)
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+
+import metrics
+import topology
+
+# --- DASHBOARD TELEMETRY ---
+# The client's System Monitor (PIDs, AI search stats) is not game data, so it
+# stays out of the engine tick and out of the 20 Hz state stream. Each network
+# process refreshes it from the shared dict once a second and hands it only to
+# clients that sent "TELEMETRY:ON", as a "telemetry" key on their next frame
+# (and only when it changed since they last got it). The client keeps the last
+# copy between updates.
+TELEMETRY_INTERVAL = 1.0
+SUBSCRIBE = "TELEMETRY:ON"
+UNSUBSCRIBE = "TELEMETRY:OFF"
+
+
+def is_request(message):
+    return message in (SUBSCRIBE, UNSUBSCRIBE)
+
+
+class Telemetry:
+    """Per network process: the latest per-shard telemetry plus who wants it"""
+
+    def __init__(self, shared_return_dict, shards):
+        self.shared = shared_return_dict
+        self.shards = shards
+        self.latest = {}          # shard -> telemetry dict
+        self.subscribers = {}     # pid -> the telemetry dict they last got
+
+    def handle(self, pid, message):
+        if message == SUBSCRIBE: self.subscribers.setdefault(pid, None)
+        else: self.subscribers.pop(pid, None)
+
+    def forget(self, pid):
+        self.subscribers.pop(pid, None)
+
+    def refresh(self):
+        """A handful of Manager reads, once per interval instead of once per tick"""
+        with metrics.timer("manager_read_ms", key="telemetry"):
+            for shard in range(self.shards):
+                self.latest[shard] = {
+                    "server_pid": os.getpid(),
+                    "engine_pid": self.shared.get(topology.shard_key('engine_pid', shard), "Unknown"),
+                    "compute_pid": self.shared.get(topology.shard_key('compute_pid', shard), "Unknown"),
+                    "compute_cycles": self.shared.get(topology.shard_key('compute_count', shard), {}),
+                }
+
+    def attach(self, pid, shard, view):
+        """Adds the shard's telemetry to a subscriber's frame if it's news to them"""
+        if pid not in self.subscribers: return
+        info = self.latest.get(shard)
+        if info is None or self.subscribers[pid] is info: return
+        self.subscribers[pid] = info
+        view["telemetry"] = info
+
+    def start(self, interval=TELEMETRY_INTERVAL):
+        def refresh_loop():
+            while True:
+                try: self.refresh()
+                except Exception as e: print(f"[NET] Telemetry Error: {e}")
+                time.sleep(interval)
+        threading.Thread(target=refresh_loop, daemon=True).start()
+        return self
@@ -0,0 +1,106 @@
+import os
+
+import metrics
+
+# --- PROCESS TOPOLOGY ---
+# How many workers of each role the server runs, and which CPUs they may use.
+#   engine:  one process per match shard (players fill shards MATCH_SIZE at a time)
+#   ai:      one bot process each, spread over the shards
+#   network: processes accepting on the same port (SO_REUSEPORT); the first one
+#            also runs spectators, UDP and the metrics endpoint
+# Pinning uses os.sched_setaffinity (Linux). Elsewhere workers run unpinned.
+ROLES = ("engine", "ai", "network")
+DEFAULT_WORKERS = {"engine": 1, "ai": 1, "network": 1}
+MIN_WORKERS = {"engine": 1, "ai": 0, "network": 1}
+MAX_WORKERS = 64
+MATCH_SIZE = 2                # Players per engine shard before the next shard fills
+REGISTRY_KEY_PREFIX = "topology:"
+
+
+def parse_workers(text):
+    """"engine=2,ai=1,network=2" -> {role: count}; unlisted roles keep their default"""
+    workers = dict(DEFAULT_WORKERS)
+    if not text: return workers
+    for item in text.split(","):
+        role, _, count = item.partition("=")
+        role = role.strip()
+        if role not in ROLES: raise ValueError(f"unknown role {role!r} (expected one of {', '.join(ROLES)})")
+        count = int(count)
+        if not MIN_WORKERS[role] <= count <= MAX_WORKERS:
+            raise ValueError(f"{role} workers must be {MIN_WORKERS[role]}-{MAX_WORKERS}")
+        workers[role] = count
+    return workers
+
+def parse_cpu_list(text):
+    """taskset-style "0-3,6" -> [0, 1, 2, 3, 6]"""
+    cpus = set()
+    for part in text.split(","):
+        first, _, last = part.strip().partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return sorted(cpus)
+
+def parse_pins(items):
+    """["engine=2", "ai=4-7"] -> {"engine": [2], "ai": [4, 5, 6, 7]}"""
+    pins = {}
+    for item in items or ():
+        role, _, cpus = item.partition("=")
+        if role not in ROLES: raise ValueError(f"unknown role {role!r} in --pin {item}")
+        pins[role] = parse_cpu_list(cpus)
+    return pins
+
+def worker_name(role, index):
+    """"engine", "engine1", "engine2", ... (metrics/profiler names; the first keeps the plain role)"""
+    return role if index == 0 else f"{role}{index}"
+
+def cpus_for(pins, role, index, count):
+    """Splits the role's CPU list between its workers when there are enough CPUs, else they share it"""
+    cpus = pins.get(role)
+    if not cpus: return None
+    if len(cpus) < count: return cpus
+    per_worker = len(cpus) // count
+    return cpus[index * per_worker:(index + 1) * per_worker]
+
+def shard_key(name, shard):
+    """Shared dict key for one engine shard; shard 0 keeps the historical names"""
+    return name if shard == 0 else f"{name}:{shard}"
+
+
+def start_worker(shared_return_dict, name, role, cpus=None):
+    """Pins the calling process and registers it for the topology report"""
+    pinned = None
+    if cpus:
+        if hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, cpus)
+                pinned = sorted(os.sched_getaffinity(0))
+            except OSError as e:
+                print(f"[TOPO] {name}: could not pin to CPUs {cpus}: {e}")
+        else:
+            print(f"[TOPO] {name}: CPU pinning not supported on this platform")
+    allowed = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+    shared_return_dict[REGISTRY_KEY_PREFIX + name] = {"role": role, "pid": os.getpid(), "cpus": allowed, "pinned": pinned is not None}
+    if pinned: print(f"[TOPO] {name} ({os.getpid()}) pinned to CPUs {pinned}")
+    return pinned
+
+
+def render_report(shared_return_dict):
+    """Plain-text table of every worker: role, PID, allowed CPUs and CPU use"""
+    snapshots = metrics.collect(shared_return_dict)
+    workers = {}
+    try:
+        for key in shared_return_dict.keys():
+            if isinstance(key, str) and key.startswith(REGISTRY_KEY_PREFIX):
+                workers[key[len(REGISTRY_KEY_PREFIX):]] = shared_return_dict[key]
+    except Exception: pass
+
+    lines = [f"{'worker':<10} {'role':<8} {'pid':>7} {'cpu%':>6} {'cpu_s':>9}  cpus"]
+    for name, info in sorted(workers.items()):
+        gauges = snapshots.get(name, {}).get("gauges", {})
+        percent = gauges.get(("process_cpu_percent", ()), 0.0)
+        seconds = gauges.get(("process_cpu_seconds", ()), 0.0)
+        cpus = info["cpus"]
+        if cpus is None: cpu_text = "?"
+        elif info["pinned"]: cpu_text = ",".join(map(str, cpus))
+        else: cpu_text = f"any ({len(cpus)})"
+        lines.append(f"{name:<10} {info['role']:<8} {info['pid']:>7} {percent:>6.1f} {seconds:>9.2f}  {cpu_text}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,349 @@
+import socket
+import struct
+import pickle
+import random
+import threading
+import time
+import argparse
+
+import metrics
+import framecodec
+
+# --- UDP TRANSPORT ---
+# Optional alternative to the TCP stream, for lossy links:
+#  * STATE packets carry a sequence number; the client keeps only the newest.
+#    Each one is a delta against the newest state the client has ACKED
+#    (falling back to a full frame when that baseline is gone).
+#  * INPUT packets repeat every input the server hasn't acknowledged yet, so
+#    a lost packet is repaired by the next one instead of by a retransmit stall.
+#
+# Packets (big endian):
+#   HELLO   B I            type, nonce
+#   WELCOME B I I          type, nonce, pid
+#   INPUT   B I I H        type, pid, acked_state_seq, count + count * (I H payload)
+#   STATE   B I I I        type, state_seq, baseline_seq (0 = full), input_ack + pickle
+#   STATE_Z                same as STATE, body compressed with framecodec
+UDP_PORT = 5560
+HELLO, WELCOME, INPUT, STATE, STATE_Z = 1, 2, 3, 4, 5
+MAX_DATAGRAM = 60000       # Bigger frames are dropped and counted (UDP has no fragmentation here)
+HISTORY_SIZE = 32          # States kept per side for delta baselines
+MAX_UNACKED_INPUTS = 32    # Oldest unacked inputs fall off if the server goes quiet
+CLIENT_TIMEOUT = 5.0       # Seconds of silence before a UDP client is dropped
+REMOVED_KEY = "_removed"            # Snakes (pids) gone since the baseline
+REMOVED_KEYS_KEY = "_removed_keys"  # Top-level keys gone since the baseline (e.g. "pong")
+
+HEADER_HELLO = struct.Struct(">BI")
+HEADER_WELCOME = struct.Struct(">BII")
+HEADER_INPUT = struct.Struct(">BIIH")
+HEADER_INPUT_ITEM = struct.Struct(">IH")
+HEADER_STATE = struct.Struct(">BIII")
+
+
+# --- LOSS SHIM ---
+class LossySocket:
+    """Wraps a UDP socket and randomly drops outgoing datagrams (for loopback testing)"""
+
+    def __init__(self, sock, loss=0.0):
+        self.sock = sock
+        self.loss = loss
+        self.dropped = 0
+
+    def sendto(self, data, addr):
+        if self.loss and random.random() < self.loss:
+            self.dropped += 1
+            return len(data)
+        return self.sock.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+# --- DELTAS ---
+def make_delta(base, state):
+    """Top-level keys that changed or went away, plus changed/removed snakes"""
+    delta = {k: v for k, v in state.items() if k != "players" and base.get(k) != v}
+    removed_keys = [k for k in base if k not in state]
+    if removed_keys: delta[REMOVED_KEYS_KEY] = removed_keys
+    base_players = base.get("players", {})
+    players = state.get("players", {})
+    delta["players"] = {pid: snake for pid, snake in players.items() if base_players.get(pid) != snake}
+    delta[REMOVED_KEY] = [pid for pid in base_players if pid not in players]
+    return delta
+
+def apply_delta(base, delta):
+    state = dict(base)
+    players = dict(base.get("players", {}))
+    for pid in delta.get(REMOVED_KEY, ()):
+        players.pop(pid, None)
+    players.update(delta.get("players", {}))
+    for k in delta.get(REMOVED_KEYS_KEY, ()):
+        state.pop(k, None)
+    for k, v in delta.items():
+        if k not in ("players", REMOVED_KEY, REMOVED_KEYS_KEY): state[k] = v
+    state["players"] = players
+    return state
+
+
+def encode_inputs(pid, acked_state_seq, pending):
+    parts = [HEADER_INPUT.pack(INPUT, pid, acked_state_seq, len(pending))]
+    for seq, payload in pending:
+        parts.append(HEADER_INPUT_ITEM.pack(seq, len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+def decode_inputs(packet):
+    _, pid, acked_state_seq, count = HEADER_INPUT.unpack_from(packet)
+    offset = HEADER_INPUT.size
+    items = []
+    for _ in range(count):
+        seq, length = HEADER_INPUT_ITEM.unpack_from(packet, offset)
+        offset += HEADER_INPUT_ITEM.size
+        items.append((seq, packet[offset:offset + length]))
+        offset += length
+    return pid, acked_state_seq, items
+
+
+# --- SERVER SIDE ---
+class UdpClient:
+    """Stands in for a ClientConnection in the server's client table"""
+
+    def __init__(self, sock, addr, pid):
+        self.sock = sock
+        self.addr = addr
+        self.pid = pid
+        self.alive = True
+        self.state_seq = 0
+        self.acked_state_seq = 0
+        self.last_input_seq = 0
+        self.history = {}           # state_seq -> state we sent
+        self.last_heard = time.time()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def push(self, frame):
+        """Sends immediately: a datagram never blocks, and newer ones supersede it"""
+        if not self.alive: return
+        self.state_seq += 1
+        baseline = self.history.get(self.acked_state_seq)
+        if baseline is not None:
+            body = make_delta(baseline, frame)
+            baseline_seq = self.acked_state_seq
+        else:
+            body = frame
+            baseline_seq = 0
+        self.history[self.state_seq] = frame
+        self.history.pop(self.state_seq - HISTORY_SIZE, None)
+
+        start = time.perf_counter()
+        serialized, packed = framecodec.maybe_compress(pickle.dumps(body, protocol=framecodec.PICKLE_PROTOCOL), stream="udp")
+        packet = HEADER_STATE.pack(STATE_Z if packed else STATE, self.state_seq, baseline_seq, self.last_input_seq) + serialized
+        metrics.observe("net_serialize_ms", (time.perf_counter() - start) * 1000, stream="udp")
+        if len(packet) > MAX_DATAGRAM:
+            self.frames_dropped += 1
+            metrics.inc("udp_oversize_frames")
+            return
+        try:
+            self.sock.sendto(packet, self.addr)
+        except OSError:
+            self.frames_dropped += 1
+            return
+        self.frames_sent += 1
+        metrics.inc("net_client_bytes_sent", len(packet), client=self.pid)
+        metrics.inc("net_bytes_sent", len(packet))
+        if baseline_seq: metrics.inc("udp_delta_frames")
+        else: metrics.inc("udp_full_frames")
+
+    def close(self, reason):
+        if not self.alive: return
+        self.alive = False
+        metrics.forget("client", self.pid)
+        print(f"[UDP] Player {self.pid} closed: {reason} (sent={self.frames_sent}, dropped={self.frames_dropped})")
+
+
+class UdpServer:
+    """One socket, one thread. Calls back into the server for joins, inputs and leaves."""
+
+    def __init__(self, port, clients, new_pid, on_join, on_message, on_leave, host="0.0.0.0", loss=0.0):
+        raw = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        raw.bind((host, port))
+        raw.settimeout(1.0)
+        self.sock = LossySocket(raw, loss)
+        self.clients = clients
+        self.new_pid = new_pid
+        self.on_join = on_join
+        self.on_message = on_message
+        self.on_leave = on_leave
+        self.by_addr = {}
+        print(f"[UDP] Listening on {host}:{port}" + (f" (dropping {loss:.0%} of sends)" if loss else ""))
+
+    def serve_forever(self):
+        next_reap = time.time() + 1
+        while True:
+            try:
+                packet, addr = self.sock.recvfrom(65536)
+                self._handle(packet, addr)
+            except socket.timeout:
+                pass
+            except Exception as e:
+                print(f"[UDP] Error: {e}")
+            if time.time() >= next_reap:
+                next_reap = time.time() + 1
+                self._reap()
+
+    def _handle(self, packet, addr):
+        kind = packet[0]
+        if kind == HELLO:
+            _, nonce = HEADER_HELLO.unpack_from(packet)
+            client = self.by_addr.get(addr)
+            if client is None:
+                client = UdpClient(self.sock, addr, self.new_pid())
+                self.by_addr[addr] = client
+                self.clients[client.pid] = client
+                print(f"[UDP] Player {client.pid} Connected ({addr[0]}:{addr[1]})")
+                self.on_join(client.pid)
+            # Repeated HELLOs (lost WELCOME) just get the same answer
+            self.sock.sendto(HEADER_WELCOME.pack(WELCOME, nonce, client.pid), addr)
+
+        elif kind == INPUT:
+            pid, acked_state_seq, items = decode_inputs(packet)
+            client = self.by_addr.get(addr)
+            if client is None or client.pid != pid: return
+            client.last_heard = time.time()
+            if acked_state_seq > client.acked_state_seq:
+                client.acked_state_seq = acked_state_seq
+            # Items are resent until acked: apply each new one exactly once, in order
+            for seq, payload in items:
+                if seq <= client.last_input_seq: continue
+                client.last_input_seq = seq
+                self.on_message(pid, pickle.loads(payload))
+            metrics.inc("udp_input_packets")
+
+    def _reap(self):
+        now = time.time()
+        for addr, client in list(self.by_addr.items()):
+            if now - client.last_heard > CLIENT_TIMEOUT:
+                del self.by_addr[addr]
+                self.clients.pop(client.pid, None)
+                client.close("timed out")
+                self.on_leave(client.pid)
+
+
+# --- CLIENT SIDE ---
+class UdpClientSession:
+    """Used by client.py when TRANSPORT = "UDP". Never blocks the render loop."""
+
+    def __init__(self, host, port=UDP_PORT, loss=0.0):
+        raw = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        raw.setblocking(False)
+        self.sock = LossySocket(raw, loss)
+        self.server = (host, port)
+        self.nonce = random.getrandbits(31)
+        self.pid = None
+        self.next_input_seq = 1
+        self.pending = []           # [(seq, payload)] not yet acked by the server
+        self.history = {}           # state_seq -> reconstructed state
+        self.latest_seq = 0
+        self.latest_state = None
+        self.stale_packets = 0
+        self.missing_baseline = 0
+
+    def send_input(self, message):
+        """Queues one input; it rides along in every packet until acknowledged"""
+        self.pending.append((self.next_input_seq, pickle.dumps(message)))
+        self.next_input_seq += 1
+        del self.pending[:-MAX_UNACKED_INPUTS]
+
+    def flush(self):
+        """Sends HELLO until welcomed, then the unacked inputs + our state ack"""
+        try:
+            if self.pid is None:
+                self.sock.sendto(HEADER_HELLO.pack(HELLO, self.nonce), self.server)
+            else:
+                self.sock.sendto(encode_inputs(self.pid, self.latest_seq, self.pending), self.server)
+        except OSError: pass
+
+    def poll(self):
+        """Drains every waiting datagram; returns the newest full state (or None)"""
+        while True:
+            try:
+                packet, addr = self.sock.recvfrom(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break
+            kind = packet[0]
+            if kind == WELCOME:
+                _, nonce, pid = HEADER_WELCOME.unpack_from(packet)
+                if nonce == self.nonce: self.pid = pid
+            elif kind in (STATE, STATE_Z):
+                self._on_state(packet)
+        return self.latest_state
+
+    def _on_state(self, packet):
+        _, seq, baseline_seq, input_ack = HEADER_STATE.unpack_from(packet)
+        # The server has these inputs now: stop resending them
+        self.pending = [item for item in self.pending if item[0] > input_ack]
+        if seq <= self.latest_seq:
+            self.stale_packets += 1  # Arrived late: a newer state already won
+            return
+        body = packet[HEADER_STATE.size:]
+        if packet[0] == STATE_Z: body = framecodec.decompress(body)
+        body = pickle.loads(body)
+        if baseline_seq:
+            base = self.history.get(baseline_seq)
+            if base is None:
+                self.missing_baseline += 1
+                return
+            state = apply_delta(base, body)
+        else:
+            state = body
+        self.latest_seq = seq
+        self.latest_state = state
+        self.history[seq] = state
+        # Keep enough history that whatever we last acked is still here
+        for old in [s for s in self.history if s <= seq - HISTORY_SIZE * 2]:
+            del self.history[old]
+
+
+# --- LOOPBACK CHECK ---
+# python udp_transport.py --loss 0.3
+# Runs a server and a client over 127.0.0.1 with dropped packets both ways
+# and checks that every input arrives once, in order, and states keep flowing.
+def loopback_check(loss, frames=300, port=UDP_PORT + 100):
+    clients = {}
+    received = []
+    pids = iter(range(1, 1000))
+    server = UdpServer(port, clients, lambda: next(pids), lambda pid: None,
+                       lambda pid, msg: received.append(msg), lambda pid: None, host="127.0.0.1", loss=loss)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    session = UdpClientSession("127.0.0.1", port, loss=loss)
+    sent = []
+    for i in range(frames):
+        if i % 3 == 0:
+            sent.append(i)
+            session.send_input(i)
+        session.flush()
+        for client in list(clients.values()):
+            client.push({"tick": i, "players": {1: [(i % 50, 5), (i % 50 + 1, 5)]}, "scores": {1: i}})
+        time.sleep(0.01)
+        session.poll()
+    # Let the last unacked inputs get through
+    for _ in range(50):
+        session.flush()
+        time.sleep(0.01)
+        session.poll()
+
+    ok = received == sent
+    print(f"[UDP] loss={loss:.0%} inputs {len(received)}/{len(sent)} in order={ok} "
+          f"newest tick={session.latest_state and session.latest_state['tick']} "
+          f"stale={session.stale_packets} missing_baseline={session.missing_baseline} "
+          f"dropped client={session.sock.dropped} server={server.sock.dropped}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UDP transport loopback check")
+    parser.add_argument("--loss", type=float, default=0.2, help="Fraction of datagrams to drop on each side")
+    args = parser.parse_args()
+    raise SystemExit(0 if loopback_check(args.loss) else 1)